@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for the API.
+
+Every benchmark is a module run with ``python -m benchmarks.<name>`` from the
+project root. They use their own SQLite file (see benchmarks/settings.py),
+so the development database is never touched.
+"""
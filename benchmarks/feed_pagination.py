@@ -0,0 +1,65 @@
+"""
+Latency of deep pages in GET /posts/: keyset cursor vs OFFSET.
+
+    python -m benchmarks.feed_pagination --posts 1000000
+
+The cursor page cost stays flat with depth, the OFFSET page cost grows with it.
+"""
+import argparse
+
+from benchmarks import utils
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 10, 100, 1000, 10000, 40000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    utils.setup()
+    utils.seed_posts(args.posts)
+
+    from rest_framework.pagination import Cursor
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from blog.models import Post
+    from blog.pagination import PostCursorPagination
+
+    factory = APIRequestFactory()
+    queryset = Post.objects.all()
+    results = []
+
+    for depth in args.depths:
+        offset = (depth - 1) * args.page_size
+        if offset >= args.posts:
+            continue
+
+        # The cursor a client holds after reading all previous pages
+        paginator = PostCursorPagination()
+        paginator.base_url = '/posts/?page_size={}'.format(args.page_size)
+        url = paginator.base_url
+        if offset:
+            boundary = queryset.order_by(*paginator.ordering)[offset - 1]
+            position = paginator._get_position_from_instance(boundary, paginator.ordering)
+            url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+        request = Request(factory.get(url))
+
+        def keyset_page():
+            PostCursorPagination().paginate_queryset(queryset, request)
+
+        def offset_page():
+            list(queryset.order_by('-updated_at', '-id')[offset:offset + args.page_size])
+
+        results.append({
+            'page': depth,
+            'cursor': utils.summary(utils.timed(keyset_page, args.repeat)),
+            'offset': utils.summary(utils.timed(offset_page, args.repeat)),
+        })
+
+    utils.report('feed_pagination', results)
+
+
+if __name__ == '__main__':
+    main()
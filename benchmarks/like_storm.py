@@ -0,0 +1,116 @@
+"""
+Concurrent likes and reads on SQLite: stock backend vs the tuned one
+(WAL, synchronous=NORMAL, BEGIN IMMEDIATE, persistent connections).
+
+    python -m benchmarks.like_storm --threads 8 --seconds 10
+
+Every thread acts like a request handler: it likes or unlikes a random post
+as a random user, or reads a page of posts, and then ends the "request" with
+close_old_connections(). Each profile runs in its own process on its own
+database file, because the journal mode is stored in the file.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks import utils
+
+PROFILES = {
+    'untuned': 'benchmarks.settings_untuned',
+    'tuned': 'benchmarks.settings',
+}
+
+
+def worker(post_ids, user_ids, write_ratio, deadline, results):
+    from django.contrib.auth.models import User
+    from django.db import OperationalError, close_old_connections
+    from blog.models import Post
+
+    local = {'writes': [], 'reads': [], 'errors': 0}
+    rng = random.Random()
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        write = rng.random() < write_ratio
+        try:
+            if write:
+                post = Post(pk=rng.choice(post_ids), like_count=0)
+                user = User(pk=rng.choice(user_ids))
+                if not post.add_like(user):
+                    post.unlike(user)
+            else:
+                list(Post.objects.values_list('id', 'title', 'like_count')[:20])
+        except OperationalError:
+            local['errors'] += 1
+        else:
+            local['writes' if write else 'reads'].append((time.perf_counter() - start) * 1000)
+        finally:
+            close_old_connections()
+    close_old_connections()
+    results.append(local)
+
+
+def measure(threads, seconds, posts, users, write_ratio):
+    """Run the storm in this process with its settings module"""
+    utils.setup()
+    utils.seed_posts(posts)
+
+    from django.db import connection
+    from blog.models import Post
+
+    user_ids = utils.seed_users(users)
+    post_ids = list(Post.objects.values_list('pk', flat=True)[:posts])
+    connection.close()
+
+    results = []
+    deadline = time.perf_counter() + seconds
+    pool = [threading.Thread(target=worker, args=(post_ids, user_ids, write_ratio, deadline, results))
+            for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    writes = sum((result['writes'] for result in results), [])
+    reads = sum((result['reads'] for result in results), [])
+    return {
+        'likes_per_second': round(len(writes) / seconds, 1),
+        'reads_per_second': round(len(reads) / seconds, 1),
+        'errors': sum(result['errors'] for result in results),
+        'like': utils.summary(writes) if writes else None,
+        'read': utils.summary(reads) if reads else None,
+    }
+
+
+def run_profile(profile, args):
+    command = [sys.executable, '-m', 'benchmarks.like_storm', '--profile', profile,
+               '--threads', str(args.threads), '--seconds', str(args.seconds),
+               '--posts', str(args.posts), '--users', str(args.users), '--write-ratio', str(args.write_ratio)]
+    database = os.path.join(os.path.dirname(utils.__file__), os.pardir, 'bench-{}.sqlite3'.format(profile))
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=PROFILES[profile], BENCH_DB=os.path.abspath(database))
+    return json.loads(subprocess.check_output(command, env=env, universal_newlines=True))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--write-ratio', type=float, default=0.5)
+    parser.add_argument('--profile', choices=sorted(PROFILES), help='Measure one profile in this process')
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        print(json.dumps(measure(args.threads, args.seconds, args.posts, args.users, args.write_ratio)))
+        return
+
+    utils.report('like_storm', {profile: run_profile(profile, args) for profile in ('untuned', 'tuned')})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Throughput and latency of the API under concurrent load, through the WSGI app.
+
+    python -m benchmarks.load --users 10000 --posts 100000 --likes 1000000 --threads 8 --seconds 30
+
+Seeds the users, posts and likes with bulk inserts, then every thread sends
+requests to test_task.wsgi.application, picking a scenario by its weight:
+
+    posts   GET /posts/ with a JWT
+    like    POST /posts/{id}/like/ with the JWT of a random user
+    users   GET /users/ with a JWT
+    token   POST /api-token-auth/, which hashes the password
+
+Reports p50 / p99 latency, requests per second and queries per request
+(from the Server-Timing header of QueryMetricsMiddleware) per scenario, as
+JSON with the git commit, so runs of two commits can be compared. Runs
+offline on the SQLite file of benchmarks.settings; --output also writes the
+report to a file. The password hasher follows DJANGO_PASSWORD_HASHER_PROFILE.
+"""
+import argparse
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+import warnings
+
+from benchmarks import utils
+
+SCENARIOS = ('posts', 'like', 'users', 'token')
+DEFAULT_MIX = 'posts=5,like=3,users=1,token=1'
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def parse_mix(value):
+    """'posts=5,like=3' to {'posts': 5, 'like': 3}"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError('Unknown scenario {}, expected one of {}'.format(
+                name, ', '.join(SCENARIOS)))
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def call(application, method, path, body=b'', authorization=None):
+    """Send one request to the WSGI app. Return the status code and the headers"""
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if authorization:
+        environ['HTTP_AUTHORIZATION'] = authorization
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = dict(headers)
+
+    result = application(environ, start_response)
+    try:
+        for _ in result:
+            pass
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started['status'], started['headers']
+
+
+class Worker(threading.Thread):
+
+    def __init__(self, application, mix, post_ids, tokens, deadline):
+        super().__init__(daemon=True)
+        self.application = application
+        self.scenarios, self.weights = zip(*mix.items())
+        self.post_ids = post_ids
+        self.tokens = tokens
+        self.deadline = deadline
+        self.results = {name: {'durations': [], 'queries': [], 'errors': 0} for name in self.scenarios}
+        self.rng = random.Random()
+
+    def request(self, scenario):
+        if scenario == 'posts':
+            return call(self.application, 'GET', '/posts/', authorization=self.rng.choice(self.tokens)[1])
+        if scenario == 'like':
+            return call(self.application, 'POST', '/posts/{}/like/'.format(self.rng.choice(self.post_ids)),
+                        authorization=self.rng.choice(self.tokens)[1])
+        if scenario == 'users':
+            return call(self.application, 'GET', '/users/', authorization=self.rng.choice(self.tokens)[1])
+        username = self.rng.choice(self.tokens)[0]
+        body = json.dumps({'username': username, 'password': utils.BENCH_PASSWORD}).encode('utf-8')
+        return call(self.application, 'POST', '/api-token-auth/', body)
+
+    def run(self):
+        while time.perf_counter() < self.deadline:
+            scenario = self.rng.choices(self.scenarios, self.weights)[0]
+            start = time.perf_counter()
+            status, headers = self.request(scenario)
+            duration = (time.perf_counter() - start) * 1000
+
+            result = self.results[scenario]
+            if status >= 400:
+                result['errors'] += 1
+                continue
+            result['durations'].append(duration)
+            match = QUERIES_RE.search(headers.get('Server-Timing', ''))
+            if match:
+                result['queries'].append(int(match.group(1)))
+
+
+def seed(users, posts, likes):
+    """Bulk insert the users, posts and likes that are missing"""
+    utils.seed_users(users)
+    utils.seed_posts(posts)
+    if likes:
+        utils.seed_likes(likes, posts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--likes', type=int, default=100000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help='Weights of the scenarios, {} by default'.format(DEFAULT_MIX))
+    parser.add_argument('--tokens', type=int, default=100, help='Number of users sending requests')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    utils.setup()
+    seed(args.users, args.posts, args.likes)
+
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from blog import caching
+    from blog.models import Like, Post
+    from test_task.wsgi import application
+
+    post_ids = list(Post.objects.order_by('pk').values_list('pk', flat=True)[:args.posts])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        tokens = [(user.username, 'JWT ' + utils.jwt_for(user))
+                  for user in User.objects.filter(username__startswith='bench_liker_').order_by('pk')[:args.tokens]]
+    rows = {'users': User.objects.count(), 'posts': Post.objects.count(), 'likes': Like.objects.count()}
+    caching.clear()
+    connection.close()
+
+    deadline = time.perf_counter() + args.seconds
+    workers = [Worker(application, args.mix, post_ids, tokens, deadline) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    scenarios = {}
+    for name in args.mix:
+        durations = [d for worker in workers for d in worker.results[name]['durations']]
+        queries = [q for worker in workers for q in worker.results[name]['queries']]
+        scenarios[name] = {
+            'requests': len(durations),
+            'errors': sum(worker.results[name]['errors'] for worker in workers),
+            'requests_per_second': round(len(durations) / elapsed, 1),
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+        }
+        if durations:
+            scenarios[name].update(utils.latency(durations))
+
+    results = {
+        'commit': utils.git_commit(),
+        'threads': args.threads,
+        'seconds': round(elapsed, 3),
+        'rows': rows,
+        'requests_per_second': round(sum(s['requests'] for s in scenarios.values()) / elapsed, 1),
+        'scenarios': scenarios,
+    }
+    utils.report('load', results)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'benchmark': 'load', 'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
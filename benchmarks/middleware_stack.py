@@ -0,0 +1,86 @@
+"""
+Per-request overhead of the default settings compared with the production
+profile (test_task/settings_production.py).
+
+    python -m benchmarks.middleware_stack --requests 2000
+
+Each profile runs in its own process. Requests are GET /posts/?page_size=1,
+served from the posts cache after the first one, so the numbers are mostly
+middleware, authentication and rendering overhead. The default profile is
+also measured with Basic auth, which hashes the password on every request.
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import warnings
+
+from benchmarks import utils
+
+PROFILES = {
+    'default': 'benchmarks.settings',
+    'production': 'benchmarks.settings_production',
+}
+
+
+def measure(requests, basic_auth):
+    """Time requests in this process with its settings module"""
+    utils.setup()
+    utils.seed_posts(1)
+
+    from django.test import Client
+
+    if basic_auth:
+        credentials = '{}:{}'.format(utils.BENCH_USERNAME, utils.BENCH_PASSWORD).encode('utf-8')
+        authorization = 'Basic ' + base64.b64encode(credentials).decode('ascii')
+    else:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            authorization = 'JWT ' + utils.jwt_for(utils.bench_user())
+
+    client = Client()
+
+    def request():
+        response = client.get('/posts/', {'page_size': 1}, HTTP_AUTHORIZATION=authorization)
+        assert response.status_code == 200, response.status_code
+
+    request()
+    return utils.summary(utils.timed(request, requests))
+
+
+def run_profile(profile, requests, basic_auth=False):
+    command = [sys.executable, '-m', 'benchmarks.middleware_stack',
+               '--profile', profile, '--requests', str(requests)]
+    if basic_auth:
+        command.append('--basic-auth')
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=PROFILES[profile])
+    output = subprocess.check_output(command, env=env, universal_newlines=True)
+    return json.loads(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--profile', choices=sorted(PROFILES), help='Measure one profile in this process')
+    parser.add_argument('--basic-auth', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        print(json.dumps(measure(args.requests, args.basic_auth)))
+        return
+
+    results = {
+        'default_jwt': run_profile('default', args.requests),
+        # Hashing dominates, a tenth of the requests is enough to show it
+        'default_basic_auth': run_profile('default', max(args.requests // 10, 1), basic_auth=True),
+        'production_jwt': run_profile('production', args.requests),
+    }
+    results['saved_per_request_ms'] = round(
+        results['default_jwt']['median_ms'] - results['production_jwt']['median_ms'], 3)
+    utils.report('middleware_stack', results)
+
+
+if __name__ == '__main__':
+    main()
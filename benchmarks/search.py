@@ -0,0 +1,103 @@
+"""
+Latency of GET /posts/search/: FTS5 with BM25 vs icontains over the Post table.
+
+    python -m benchmarks.search --posts 1000000
+
+fts5_backend is the index query alone, fts5 the whole request.
+
+Posts are made of words drawn from a Zipf distribution over --vocabulary
+words, so queries range from rare words to words in most posts. The
+database is bench-search.sqlite3, apart from the other benchmarks' posts.
+"""
+import argparse
+import io
+import os
+import random
+import string
+
+from benchmarks import utils
+
+
+def make_vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))))
+    return sorted(words, key=lambda word: (len(word), word))
+
+
+def seed_search_posts(count, vocabulary, body_words, batch_size=10000):
+    """Make sure there are at least `count` posts, then index them all at once"""
+    from django.core.management import call_command
+    from blog.models import Post
+
+    rng = random.Random(0)
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    user = utils.bench_user()
+    missing = count - Post.objects.count()
+    if missing <= 0:
+        return
+    while missing > 0:
+        size = min(batch_size, missing)
+        words = rng.choices(vocabulary, weights, k=size * (body_words + 5))
+        posts = []
+        for i in range(size):
+            chunk = words[i * (body_words + 5):(i + 1) * (body_words + 5)]
+            posts.append(Post(user=user, title=' '.join(chunk[:5]), body=' '.join(chunk[5:])))
+        Post.objects.bulk_create(posts)
+        missing -= size
+    call_command('rebuild_search_index', stdout=io.StringIO())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--body-words', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('BENCH_DB', os.path.abspath(
+        os.path.join(os.path.dirname(utils.__file__), os.pardir, 'bench-search.sqlite3')))
+    utils.setup()
+    vocabulary = make_vocabulary(args.vocabulary, random.Random(0))
+    seed_search_posts(args.posts, vocabulary, args.body_words)
+
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+    from blog import search
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='JWT ' + utils.jwt_for(utils.bench_user()))
+
+    # Words by rank in the Zipf distribution: the first one is in most posts
+    queries = {
+        'rare word': vocabulary[-1],
+        'mid word': vocabulary[len(vocabulary) // 100],
+        'two common words': '{} {}'.format(vocabulary[1], vocabulary[2]),
+    }
+    results = {}
+    for name, query in queries.items():
+        def search_page():
+            assert client.get('/posts/search/', {'q': query}).status_code == 200
+
+        def backend_only():
+            search.get_backend().search(query, 0, 21)
+
+        def search_page_2():
+            assert client.get('/posts/search/', {'q': query, 'page': 2}).status_code == 200
+
+        with override_settings(POST_SEARCH_BACKEND='blog.search.DatabaseBackend'):
+            icontains = utils.summary(utils.timed(search_page, min(args.repeat, 3)))
+        results[name] = {
+            'query': query,
+            'fts5_backend': utils.summary(utils.timed(backend_only, args.repeat)),
+            'fts5': utils.summary(utils.timed(search_page, args.repeat)),
+            'fts5_page_2': utils.summary(utils.timed(search_page_2, args.repeat)),
+            'icontains': icontains,
+        }
+
+    utils.report('search', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Cost of serializing list pages: DRF serializers over instances vs the values fast path.
+
+    python -m benchmarks.serialization --items 1000
+
+For a page of --items Posts and of --items users, times the query, the
+serializer and the JSON rendering of both paths:
+
+    drf     instances, PostSerializer(many=True).data, JSONRenderer
+    values  values_queryset() rows, to_representation_values(), FastJSONRenderer
+
+and checks that both paths give the same bytes. FastJSONRenderer uses
+orjson when it is installed, the report says which encoder ran.
+"""
+import argparse
+
+from benchmarks import utils
+
+
+def compare(name, drf_rows, drf_data, values_rows, values_data, repeat):
+    """Time both paths of one page, return their timings and the speedups"""
+    from rest_framework.renderers import JSONRenderer
+    from test_task.serialization import FastJSONRenderer
+
+    drf_bytes = JSONRenderer().render(drf_data(drf_rows()))
+    values_bytes = FastJSONRenderer().render(values_data(values_rows()))
+    assert drf_bytes == values_bytes, '{}: the paths render different bytes'.format(name)
+
+    def drf_total():
+        JSONRenderer().render(drf_data(drf_rows()))
+
+    def values_total():
+        FastJSONRenderer().render(values_data(values_rows()))
+
+    rows, data = drf_rows(), drf_data(drf_rows())
+    result = {
+        'drf': {
+            'query': utils.summary(utils.timed(drf_rows, repeat)),
+            'serialize': utils.summary(utils.timed(lambda: drf_data(rows), repeat)),
+            'render': utils.summary(utils.timed(lambda: JSONRenderer().render(data), repeat)),
+            'total': utils.summary(utils.timed(drf_total, repeat)),
+        },
+    }
+    rows, data = values_rows(), values_data(values_rows())
+    result['values'] = {
+        'query': utils.summary(utils.timed(values_rows, repeat)),
+        'serialize': utils.summary(utils.timed(lambda: values_data(rows), repeat)),
+        'render': utils.summary(utils.timed(lambda: FastJSONRenderer().render(data), repeat)),
+        'total': utils.summary(utils.timed(values_total, repeat)),
+    }
+    result['speedup'] = {
+        step: round(result['drf'][step]['median_ms'] / result['values'][step]['median_ms'], 1)
+        for step in ('query', 'serialize', 'render', 'total')
+    }
+    result['bytes'] = len(values_bytes)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    utils.setup()
+    utils.seed_posts(args.items)
+    utils.seed_users(args.items)
+
+    from django.contrib.auth.models import User
+    from blog.models import Post
+    from blog.serializers import PostSerializer
+    from blog.views import PostAPIView
+    from test_task import serialization
+    from user_profile.serializers import RegistrationSerializer, UserSerializer
+
+    user = utils.bench_user()
+    # The columns of GET /posts/, body is left out by default
+    fields = [name for name in PostSerializer().fields if name != 'body']
+    posts = Post.objects.with_liked_by(user).order_by('-updated_at', '-id')
+    post_serializer = PostSerializer(fields=fields, context={'pending_likes': {}})
+    users = User.objects.order_by('id')
+    user_serializer = UserSerializer()
+
+    results = {
+        'items': args.items,
+        'encoder': 'orjson' if serialization.orjson else 'json',
+        'posts': compare(
+            'posts',
+            lambda: list(posts.only(*PostAPIView().get_columns(fields))[:args.items]),
+            lambda rows: PostSerializer(rows, many=True, fields=fields, context={'pending_likes': {}}).data,
+            lambda: list(post_serializer.values_queryset(posts)[:args.items]),
+            post_serializer.to_representation_values,
+            args.repeat,
+        ),
+        'users': compare(
+            'users',
+            lambda: list(users.only(*UserSerializer.Meta.fields)[:args.items]),
+            lambda rows: RegistrationSerializer(rows, many=True).data,
+            lambda: list(user_serializer.values_queryset(users)[:args.items]),
+            user_serializer.to_representation_values,
+            args.repeat,
+        ),
+    }
+    utils.report('serialization', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,10 @@
+"""Settings for benchmarks: project settings with a separate SQLite file"""
+import os
+
+from test_task.settings import *  # noqa: F401,F403
+from test_task.settings import BASE_DIR, DATABASES
+
+DEBUG = False
+ALLOWED_HOSTS = ['testserver', 'localhost', '127.0.0.1']
+
+DATABASES['default']['NAME'] = os.environ.get('BENCH_DB', os.path.join(BASE_DIR, 'bench.sqlite3'))
@@ -0,0 +1,10 @@
+"""Production profile settings for benchmarks, with the benchmark SQLite file"""
+import os
+
+from django.core.management.utils import get_random_secret_key
+
+# A key for this run only, the production profile has no default
+os.environ.setdefault('DJANGO_SECRET_KEY', get_random_secret_key())
+
+from test_task.settings_production import *  # noqa: F401,F403,E402
+from benchmarks.settings import ALLOWED_HOSTS, DATABASES  # noqa: F401,E402
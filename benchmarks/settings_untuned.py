@@ -0,0 +1,10 @@
+"""Benchmark settings with the stock SQLite backend: rollback journal, no pragmas, no persistent connections"""
+from benchmarks.settings import *  # noqa: F401,F403
+from benchmarks.settings import DATABASES
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASES['default']['NAME'],
+    }
+}
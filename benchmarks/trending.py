@@ -0,0 +1,71 @@
+"""
+Trending posts over a large Like table: stored scores vs counting likes per request.
+
+    python -m benchmarks.trending --likes 10000000
+
+GET /posts/trending/ reads the top of the PostScore.score index, so its cost
+does not depend on the number of likes. The naive ranking counts the likes
+of the last day for every request. refresh_trending is timed once, it reads
+the likes of the window from the (created, post) index.
+"""
+import argparse
+import io
+import time
+from datetime import timedelta
+
+from benchmarks import utils
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--likes', type=int, default=10000000)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--window-hours', type=float, default=24 * 14,
+                        help='Likes are made at random times over this many hours')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    utils.setup()
+    utils.seed_posts(args.posts)
+    utils.seed_likes(args.likes, args.posts, args.window_hours)
+
+    from django.core.management import call_command
+    from django.db.models import Count
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from blog.models import Like, Post, PostScore
+
+    start = time.perf_counter()
+    call_command('refresh_trending', stdout=io.StringIO())
+    refresh_ms = (time.perf_counter() - start) * 1000
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='JWT ' + utils.jwt_for(utils.bench_user()))
+    url = '/posts/trending/?limit={}&fields=id,title,like_count'.format(args.limit)
+
+    def stored_scores():
+        assert client.get(url).status_code == 200
+
+    def count_per_request():
+        since = timezone.now() - timedelta(days=1)
+        list(Post.objects.filter(like__created__gte=since).annotate(recent=Count('like'))
+             .order_by('-recent').values_list('id', 'title', 'like_count')[:args.limit])
+
+    post = Post.objects.order_by('pk').first()
+
+    def record_like():
+        PostScore.objects.record_likes([(post.pk, timezone.now())])
+
+    utils.report('trending', {
+        'likes': Like.objects.count(),
+        'scored_posts': PostScore.objects.count(),
+        'refresh_trending_ms': round(refresh_ms, 3),
+        'record_like': utils.summary(utils.timed(record_like, args.repeat)),
+        'trending_endpoint': utils.summary(utils.timed(stored_scores, args.repeat)),
+        'count_per_request': utils.summary(utils.timed(count_per_request, min(args.repeat, 5))),
+    })
+
+
+if __name__ == '__main__':
+    main()
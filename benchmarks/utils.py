@@ -0,0 +1,152 @@
+import json
+import math
+import os
+import statistics
+import subprocess
+import time
+
+
+def setup():
+    """Configure Django for a benchmark run, migrate the benchmark database and create its cache tables"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    call_command('createcachetable', verbosity=0)
+
+
+BENCH_USERNAME = 'bench_author'
+BENCH_PASSWORD = 'bench_password'
+
+
+def bench_user():
+    """The user that owns seeded posts, with BENCH_PASSWORD as password"""
+    from django.contrib.auth.models import User
+
+    user, created = User.objects.get_or_create(username=BENCH_USERNAME)
+    if created:
+        user.set_password(BENCH_PASSWORD)
+        user.save()
+    return user
+
+
+def seed_users(count, batch_size=10000):
+    """
+    Make sure there are at least `count` users `bench_liker_<i>` and return their ids.
+    They all share one hash of BENCH_PASSWORD, so seeding hashes once
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+
+    existing = User.objects.filter(username__startswith='bench_liker_').count()
+    password = make_password(BENCH_PASSWORD)
+    for start in range(existing, count, batch_size):
+        User.objects.bulk_create(User(username='bench_liker_{}'.format(i), password=password)
+                                 for i in range(start, min(start + batch_size, count)))
+    return list(User.objects.filter(username__startswith='bench_liker_').order_by('pk')
+                .values_list('pk', flat=True)[:count])
+
+
+def seed_likes(count, posts, window_hours=24 * 14):
+    """
+    Make sure there are at least `count` likes on the first `posts` posts, made over
+    the last `window_hours` by bench_liker users. Likes are inserted in SQL, a model
+    instance per like is too slow for millions of them
+    """
+    from django.db import connection, transaction
+    from blog.models import Like, Post
+
+    user_ids = seed_users(-(-count // posts))
+    start = Like.objects.count()
+    if start >= count:
+        return
+    post_ids = Post.objects.order_by('pk').values_list('pk', flat=True)[:posts]
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS bench_user (i INTEGER PRIMARY KEY, id INTEGER)')
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS bench_post (i INTEGER PRIMARY KEY, id INTEGER)')
+        cursor.execute('DELETE FROM bench_user')
+        cursor.execute('DELETE FROM bench_post')
+        cursor.executemany('INSERT INTO bench_user VALUES (%s, %s)', list(enumerate(user_ids)))
+        cursor.executemany('INSERT INTO bench_post VALUES (%s, %s)', list(enumerate(post_ids)))
+
+    # Like n is made by user n // posts on post n % posts, so pairs never repeat
+    for batch_start in range(start, count, 1000000):
+        batch_end = min(batch_start + 1000000, count)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'WITH RECURSIVE seq(n) AS (SELECT %s UNION ALL SELECT n + 1 FROM seq WHERE n + 1 < %s) '
+                'INSERT INTO blog_like (user_id, post_id, created) '
+                "SELECT u.id, p.id, strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now', "
+                "'-' || (abs(random()) %% %s) || ' seconds') "
+                'FROM seq JOIN bench_user u ON u.i = seq.n / %s JOIN bench_post p ON p.i = seq.n %% %s',
+                [batch_start, batch_end, int(window_hours * 3600), posts, posts])
+
+
+def jwt_for(user):
+    """A valid JWT for the user, as /api-token-auth/ would return it"""
+    from rest_framework_jwt.settings import api_settings
+
+    return api_settings.JWT_ENCODE_HANDLER(api_settings.JWT_PAYLOAD_HANDLER(user))
+
+
+def seed_posts(count, batch_size=10000):
+    """Make sure the benchmark database has at least `count` posts"""
+    from blog.models import Post
+
+    user = bench_user()
+    missing = count - Post.objects.count()
+    while missing > 0:
+        size = min(batch_size, missing)
+        Post.objects.bulk_create(
+            [Post(user=user, title='Bench post', body='Bench body') for _ in range(size)]
+        )
+        missing -= size
+
+
+def timed(func, repeat):
+    """Run func `repeat` times and return the list of durations in ms"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def summary(durations):
+    """Median and worst duration of a timed() run"""
+    return {
+        'median_ms': round(statistics.median(durations), 3),
+        'max_ms': round(max(durations), 3),
+    }
+
+
+def percentile(durations, fraction):
+    """Nearest-rank percentile of a list of durations"""
+    ordered = sorted(durations)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def latency(durations):
+    """p50, p99 and worst duration in ms"""
+    return {
+        'p50_ms': round(percentile(durations, 0.5), 3),
+        'p99_ms': round(percentile(durations, 0.99), 3),
+        'max_ms': round(max(durations), 3),
+    }
+
+
+def git_commit():
+    """Commit of the working tree, so reports of different commits can be compared"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True,
+                                       stderr=subprocess.DEVNULL, cwd=os.path.dirname(__file__)).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(name, results):
+    """Print benchmark results as JSON"""
+    print(json.dumps({'benchmark': name, 'results': results}, indent=2))
@@ -0,0 +1,69 @@
+"""
+Bulk post import: rows are validated a batch at a time and each batch is
+inserted with bulk_create in its own transaction.
+"""
+from django.db import DatabaseError, transaction
+from rest_framework.exceptions import ValidationError
+
+from blog import caching, search, timeline
+from blog.models import Post
+from blog.serializers import PostSerializer
+from test_task.batching import batches
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def import_posts(rows, user, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Create Posts of the user from an iterable of dicts, as POST /posts/ takes them.
+    Returns the number of Posts created and {row index: errors} for the rows skipped.
+    """
+    created, errors = 0, {}
+    try:
+        for number, batch in enumerate(batches(rows, batch_size)):
+            valid = validate_batch(batch, number * batch_size, errors)
+            posts = [Post(user=user, **data) for data in valid.values()]
+            created += insert_batch(list(valid), posts, errors)
+    finally:
+        if created:
+            caching.invalidate()
+            timeline.drop(user.pk)
+    return created, errors
+
+
+def validate_batch(batch, offset, errors):
+    """Return {row index: validated data} for the valid rows of the batch"""
+    # One serializer for the batch, as PostSerializer(many=True) does, but an
+    # invalid row does not discard the others
+    serializer = PostSerializer(many=True).child
+    valid = {}
+    for index, row in enumerate(batch, offset):
+        try:
+            valid[index] = serializer.run_validation(row)
+        except ValidationError as exc:
+            errors[index] = exc.detail
+    return valid
+
+
+def insert_batch(indexes, posts, errors):
+    try:
+        with transaction.atomic():
+            # bulk_create sends no post_save and does not set the ids on SQLite:
+            # the new Posts are the ones after the last id
+            last_pk = Post.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            Post.objects.bulk_create(posts)
+            search.get_backend().index(Post.objects.filter(pk__gt=last_pk))
+        return len(posts)
+    except DatabaseError:
+        pass
+
+    # Find the rows the database refuses, one at a time
+    created = 0
+    for index, post in zip(indexes, posts):
+        try:
+            with transaction.atomic():
+                post.save()
+            created += 1
+        except DatabaseError as exc:
+            errors[index] = ValidationError({'non_field_errors': [str(exc)]}).detail
+    return created
@@ -0,0 +1,120 @@
+"""
+Versioned read-through cache for PostAPIView list and retrieve responses.
+
+Every key contains a version number. Writes bump the version instead of
+deleting keys, so a stale entry is never read again and nothing has to be
+scanned. Old entries are dropped by the backend on TTL or when it culls
+(TIMEOUT and MAX_ENTRIES of the 'posts' cache in settings.CACHES).
+"""
+import hashlib
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from test_task import replicas
+
+CACHE_ALIAS = 'posts'
+LIST_VERSION_KEY = 'posts:list:version'
+POST_VERSION_KEY = 'posts:post:{}:version'
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _initial_version():
+    # Larger than any version handed out before, if the version key was culled
+    return int(time.time() * 1000)
+
+
+def _get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial_version(), timeout=None)
+
+
+def _bump(*post_ids):
+    _bump_version(LIST_VERSION_KEY)
+    for pk in post_ids:
+        _bump_version(POST_VERSION_KEY.format(pk))
+
+
+def invalidate(*post_ids):
+    """
+    Invalidate cached lists and the given Posts.
+    Bumped now and again after commit, so a read between the write and
+    the commit cannot keep the old rows under the new version
+    """
+    _bump(*post_ids)
+    transaction.on_commit(lambda: _bump(*post_ids))
+
+
+def _request_key(request):
+    return hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+
+
+def list_key(request):
+    return 'posts:list:{}:{}:{}'.format(
+        _get_version(LIST_VERSION_KEY), request.user.pk, _request_key(request))
+
+
+def post_key(request, pk):
+    return 'posts:post:{}:{}:{}:{}'.format(
+        pk, _get_version(POST_VERSION_KEY.format(pk)), request.user.pk, _request_key(request))
+
+
+def cached_response(key, view, request, *args, **kwargs):
+    """
+    Return the cached data for key, or call the view and cache its 200 response.
+    A response read from a replica may miss the latest writes, so it is kept
+    only for REPLICA_PIN_SECONDS, the lag the replicas are allowed
+    """
+    cache = get_cache()
+    data = cache.get(key)
+    if data is not None:
+        _count('hits')
+        return Response(data)
+
+    _count('misses')
+    response = view(request, *args, **kwargs)
+    if response.status_code == status.HTTP_200_OK:
+        timeout = replicas.pin_seconds() if replicas.reading_from_replicas() else DEFAULT_TIMEOUT
+        cache.set(key, response.data, timeout=timeout)
+    return response
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    """Return hit and miss counters of this process"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def clear():
+    """Drop all cached responses and reset the counters"""
+    get_cache().clear()
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
@@ -0,0 +1,71 @@
+"""
+Streaming export of the Post and Like tables as NDJSON or CSV.
+
+Rows are read in keyset chunks ordered by pk, one query per chunk, so memory
+stays the same whatever the size of the table. QuerySet.iterator() would not
+do it here: SQLite cannot use chunked reads and fetches the whole result first.
+Chunks are separate queries, so rows written during an export may or may not
+be in it.
+"""
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from blog.models import Like, Post
+
+TABLES = {
+    'posts': (Post, ('id', 'user_id', 'title', 'body', 'created_at', 'updated_at', 'like_count')),
+    'likes': (Like, ('id', 'user_id', 'post_id', 'created')),
+}
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+DEFAULT_CHUNK_SIZE = 1000
+
+_encoder = DjangoJSONEncoder()
+
+
+def iter_chunks(model, columns, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of value tuples for the columns, ordered by pk. The first column is the pk"""
+    queryset = model.objects.order_by('pk').values_list(*columns)
+    chunk = list(queryset[:chunk_size])
+    while chunk:
+        last_pk = chunk[-1][0]
+        yield chunk
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+
+
+def export_value(value):
+    """Values as json writes them, datetimes and decimals as DjangoJSONEncoder does"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return _encoder.default(value)
+
+
+def iter_ndjson(columns, chunks):
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, map(export_value, row)))) + '\n' for row in chunk)
+
+
+def iter_csv(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([export_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue()
+
+
+def export(table, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the table as text in the format, one piece per chunk of rows"""
+    model, columns = TABLES[table]
+    chunks = iter_chunks(model, columns, chunk_size)
+    if fmt == 'csv':
+        return iter_csv(columns, chunks)
+    return iter_ndjson(columns, chunks)
@@ -0,0 +1,205 @@
+"""
+Write-behind buffer for likes, used when settings.LIKE_WRITE_BEHIND is on.
+
+Like and unlike requests only record the new state of (user, post) in this
+process. A worker thread writes the buffered states to the database when
+LIKE_BUFFER_MAX_SIZE of them are pending or every LIKE_BUFFER_FLUSH_SECONDS.
+Repeated likes and unlikes of the same post by the same user are coalesced
+into the last one.
+
+Responses to the acting user show the buffered state (see overlay()), so
+they read their own writes before the flush. Other users see the change
+after the flush. The buffer is flushed at interpreter exit; likes of a
+process that is killed are lost.
+
+A batch whose write fails goes back to the buffer for the next flush, below
+the states buffered meanwhile. A locked database is retried until it is
+free; other errors LIKE_BUFFER_MAX_RETRIES times in a row, then the batch is
+logged and dropped so that it does not block the likes behind it.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, transaction
+
+from blog import caching
+from blog.models import Like, Post, PostScore
+
+logger = logging.getLogger(__name__)
+
+
+def enabled():
+    return getattr(settings, 'LIKE_WRITE_BEHIND', False)
+
+
+def max_size():
+    return getattr(settings, 'LIKE_BUFFER_MAX_SIZE', 500)
+
+
+def flush_seconds():
+    return getattr(settings, 'LIKE_BUFFER_FLUSH_SECONDS', 1.0)
+
+
+def max_retries():
+    return getattr(settings, 'LIKE_BUFFER_MAX_RETRIES', 3)
+
+
+def overlay(liked, like_count, pending):
+    """The liked state and like_count once the pending state of the user is written"""
+    if pending is None or pending == liked:
+        return liked, like_count
+    return pending, like_count + (1 if pending else -1)
+
+
+class LikeBuffer:
+
+    def __init__(self):
+        # {user_id: {post_id: liked}}
+        self._pending = {}
+        self._size = 0
+        # The batch being written, still visible to its users until it is committed
+        self._in_flight = {}
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        self._stopping = False
+        # Flushes failed in a row with an error other than OperationalError
+        self._failures = 0
+
+    def add(self, user_id, post_ids, liked):
+        """Buffer the like (liked=True) or unlike of the Posts by the user"""
+        with self._condition:
+            posts = self._pending.setdefault(user_id, {})
+            for post_id in post_ids:
+                if post_id not in posts:
+                    self._size += 1
+                posts[post_id] = liked
+            self._start_worker()
+            if self._size >= max_size():
+                self._condition.notify_all()
+
+    def pending_for_user(self, user_id):
+        """{post_id: liked} of the likes and unlikes of the user not written yet"""
+        with self._condition:
+            pending = dict(self._in_flight.get(user_id, {}))
+            pending.update(self._pending.get(user_id, {}))
+            return pending
+
+    def set_like(self, user, post, liked):
+        """
+        Buffer the like or unlike of a Post annotated with_liked_by(user).
+        Return whether the state changed and the like_count the user sees
+        """
+        with self._condition:
+            current = self.pending_for_user(user.pk).get(post.pk, post.liked)
+            self.add(user.pk, [post.pk], liked)
+        caching.invalidate(post.pk)
+        return current != liked, overlay(post.liked, post.like_count, liked)[1]
+
+    def flush(self):
+        """Write the pending likes and unlikes to the database now"""
+        with self._flush_lock:
+            with self._condition:
+                batch, self._pending, self._size = self._pending, {}, 0
+                self._in_flight = batch
+            try:
+                if batch:
+                    write(batch)
+            except OperationalError:
+                # Locked database
+                logger.exception('Like buffer flush failed, retrying with the next flush')
+                self._requeue(batch)
+            except Exception:
+                self._failures += 1
+                if self._failures > max_retries():
+                    logger.exception('Like buffer flush failed %d times, dropped the likes of %d users: %r',
+                                     self._failures, len(batch), batch)
+                    self._failures = 0
+                else:
+                    logger.exception('Like buffer flush failed, retry %d of %d with the next flush',
+                                     self._failures, max_retries())
+                    self._requeue(batch)
+            else:
+                self._failures = 0
+            finally:
+                with self._condition:
+                    self._in_flight = {}
+                    self._condition.notify_all()
+
+    def _requeue(self, batch):
+        """Keep the states of a failed batch for the next flush unless newer ones came"""
+        with self._condition:
+            for user_id, posts in batch.items():
+                pending = self._pending.setdefault(user_id, {})
+                for post_id, liked in posts.items():
+                    if post_id not in pending:
+                        pending[post_id] = liked
+                        self._size += 1
+
+    def stop(self):
+        """Stop the worker and flush what is left from this thread. Registered with atexit"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join()
+        self.flush()
+
+    def _start_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name='like-buffer', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    if not self._stopping and self._size < max_size():
+                        self._condition.wait(flush_seconds())
+                    if self._stopping:
+                        # stop() flushes what is left
+                        return
+                self.flush()
+        finally:
+            connection.close()
+
+
+def write(batch):
+    """Write {user_id: {post_id: liked}} in one transaction and fix like_count of the Posts"""
+    post_ids = {post_id for posts in batch.values() for post_id in posts}
+    with transaction.atomic():
+        # Likes of Posts or users deleted meanwhile are dropped
+        existing_posts = set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+        existing_users = set(User.objects.filter(pk__in=batch).values_list('pk', flat=True))
+
+        likes = {(user_id, post_id)
+                 for user_id, posts in batch.items() if user_id in existing_users
+                 for post_id, liked in posts.items() if liked and post_id in existing_posts}
+        if likes:
+            # Likes already stored do not count again in the trending scores
+            likes -= set(Like.objects.filter(user_id__in={user_id for user_id, _ in likes},
+                                             post_id__in={post_id for _, post_id in likes})
+                         .values_list('user_id', 'post_id'))
+            likes = [Like(user_id=user_id, post_id=post_id) for user_id, post_id in likes]
+            Like.objects.insert_ignore_conflicts(likes)
+            PostScore.objects.record_likes([(like.post_id, like.created) for like in likes])
+        for user_id, posts in batch.items():
+            unliked = [post_id for post_id, liked in posts.items() if not liked]
+            if unliked:
+                Like.objects.filter(user_id=user_id, post_id__in=unliked).delete_scored()
+
+        Post.objects.filter(pk__in=existing_posts).recount_likes()
+        caching.invalidate(*existing_posts)
+
+
+_buffer = LikeBuffer()
+atexit.register(_buffer.stop)
+
+
+def get_buffer():
+    return _buffer
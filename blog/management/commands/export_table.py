@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from blog import export
+
+
+class Command(BaseCommand):
+    help = 'Stream all rows of the posts or likes table as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=sorted(export.TABLES))
+        parser.add_argument('--fmt', choices=sorted(export.FORMATS), default='ndjson')
+        parser.add_argument('--output', help='File to write, stdout by default')
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE,
+                            help='Number of rows read per query')
+
+    def handle(self, *args, **options):
+        pieces = export.export(options['table'], options['fmt'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(pieces)
+        else:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
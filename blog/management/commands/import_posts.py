@@ -0,0 +1,40 @@
+import json
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.bulk import DEFAULT_BATCH_SIZE, import_posts
+from test_task.batching import NDJSONRows
+
+
+class Command(BaseCommand):
+    help = 'Create posts from a file with one JSON post per line, as POST /posts/ takes it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file, or - for stdin')
+        parser.add_argument('--user', required=True, help='Username of the author of the posts')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of posts validated and inserted per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError('User "{}" does not exist'.format(options['user']))
+
+        if options['path'] == '-':
+            created, errors = self.load(sys.stdin, user, options)
+        else:
+            with open(options['path'], encoding='utf-8') as lines:
+                created, errors = self.load(lines, user, options)
+
+        for number in sorted(errors):
+            self.stderr.write('Line {}: {}'.format(number, json.dumps(errors[number])))
+        self.stdout.write('Created {} posts, skipped {}'.format(created, len(errors)))
+
+    def load(self, lines, user, options):
+        """Import the lines, return the number of Posts created and {line number: errors}"""
+        rows = NDJSONRows(lines)
+        created, errors = import_posts(rows, user, batch_size=options['batch_size'])
+        return created, rows.line_errors(errors)
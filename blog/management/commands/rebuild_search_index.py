@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog import search
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Index the title and body of every post again for GET /posts/search/'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.get_backend().rebuild()
+        self.stdout.write('Indexed {} posts'.format(Post.objects.count()))
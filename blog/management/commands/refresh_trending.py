@@ -0,0 +1,56 @@
+import math
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+
+from blog import trending
+from blog.models import Like, Post, PostScore
+from test_task.batching import batches
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending scores of all posts from the likes of the window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Number of likes fetched at a time')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        rate = trending.rate()
+        reference = now.timestamp()
+        # Sums of exp(rate * (t - reference)), which stay <= 1 per like
+        sums = {}
+        counted = 0
+
+        def add(rows):
+            nonlocal counted
+            for post_id, t in rows:
+                sums[post_id] = sums.get(post_id, 0.0) + math.exp(rate * (t - reference))
+                counted += 1
+
+        # Read without a transaction, so likes are not blocked while they are summed.
+        # A raw cursor, because QuerySet.iterator() fetches everything at once on SQLite
+        likes = Like.objects.filter(created__gte=trending.window_start(now), created__lte=now) \
+            .annotate(t=trending.Epoch('created')).values_list('post_id', 't')
+        sql, params = likes.query.sql_with_params()
+        with connections[likes.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            for rows in iter(lambda: cursor.fetchmany(options['chunk_size']), []):
+                add(rows)
+
+        with transaction.atomic():
+            # Likes made while the others were summed
+            add(Like.objects.filter(created__gt=now).annotate(t=trending.Epoch('created'))
+                .values_list('post_id', 't'))
+            PostScore.objects.all().delete()
+            count = 0
+            for post_ids in batches(sums, 500):
+                # Posts deleted meanwhile
+                existing = list(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+                PostScore.objects.bulk_create([PostScore(post_id=pk, score=rate * reference + math.log(sums[pk]))
+                                               for pk in existing])
+                count += len(existing)
+
+        self.stdout.write('Scored {} posts from {} likes'.format(count, counted))
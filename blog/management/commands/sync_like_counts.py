@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from blog import caching
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Re-sync the stored Post.like_count with the number of Like rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts checked and updated per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        checked = fixed = 0
+
+        while True:
+            batch = list(Post.objects.filter(pk__gt=last_pk).order_by('pk')
+                         .annotate(actual=Count('like'))
+                         .values_list('pk', 'like_count', 'actual')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            checked += len(batch)
+
+            # Counted again inside the UPDATE, so likes added meanwhile are not lost
+            drifted = [pk for pk, stored, actual in batch if stored != actual]
+            if drifted:
+                Post.objects.filter(pk__in=drifted).recount_likes()
+                caching.invalidate(*drifted)
+                fixed += len(drifted)
+
+        self.stdout.write('Checked {} posts, fixed {} like counts'.format(checked, fixed))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from test_task.replicas import copy_sqlite_database, replica_aliases
+
+
+class Command(BaseCommand):
+    help = "Refresh the SQLite replicas with a copy of the 'default' database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Replica aliases, DATABASE_REPLICAS by default')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replica_aliases()
+        if not aliases:
+            raise CommandError('No replicas given and DATABASE_REPLICAS is empty')
+
+        source = connections[DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            replica = connections[alias]
+            if source.vendor != 'sqlite' or replica.vendor != 'sqlite':
+                raise CommandError('Only SQLite replicas can be copied, "{}" is {}'.format(alias, replica.vendor))
+            # Connections opened later read the new file
+            replica.close()
+            copy_sqlite_database(source, replica.settings_dict['NAME'])
+            self.stdout.write('Copied {} to {}'.format(DEFAULT_DB_ALIAS, alias))
@@ -0,0 +1,29 @@
+# Generated by Django 2.0.5 on 2026-10-18 20:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_like_count(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Like = apps.get_model('blog', 'Like')
+    likes = (Like.objects.filter(post=OuterRef('pk')).order_by()
+             .values('post').annotate(count=Count('pk')).values('count'))
+    Post.objects.update(like_count=Coalesce(Subquery(likes, output_field=models.IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_like_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.0.5 on 2026-10-18 20:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_post_like_count'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='post',
+            options={'ordering': ('-updated_at', '-id'), 'verbose_name_plural': 'Posts'},
+        ),
+    ]
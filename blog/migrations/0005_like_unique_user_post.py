@@ -0,0 +1,42 @@
+# Generated by Django 2.0.5 on 2026-10-18 20:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def delete_duplicate_likes(apps, schema_editor):
+    """Keep the first like of every (user, post) pair and recount affected posts"""
+    Post = apps.get_model('blog', 'Post')
+    Like = apps.get_model('blog', 'Like')
+    duplicates = (Like.objects.order_by().values('user', 'post')
+                  .annotate(first_id=Min('id'), count=Count('id')).filter(count__gt=1))
+    post_ids = set()
+    for duplicate in duplicates:
+        Like.objects.filter(user=duplicate['user'], post=duplicate['post']) \
+            .exclude(id=duplicate['first_id']).delete()
+        post_ids.add(duplicate['post'])
+
+    if post_ids:
+        likes = (Like.objects.filter(post=OuterRef('pk')).order_by()
+                 .values('post').annotate(count=Count('pk')).values('count'))
+        Post.objects.filter(pk__in=post_ids).update(
+            like_count=Coalesce(Subquery(likes, output_field=models.IntegerField()), 0)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('blog', '0004_post_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_likes, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='like',
+            unique_together={('user', 'post')},
+        ),
+    ]
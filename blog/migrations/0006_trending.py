@@ -0,0 +1,25 @@
+# Generated by Django 2.0.5 on 2026-10-18 21:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_like_unique_user_post'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='blog.Post')),
+                ('score', models.FloatField(db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['created', 'post'], name='like_created_post_idx'),
+        ),
+    ]
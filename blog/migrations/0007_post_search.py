@@ -0,0 +1,31 @@
+# Generated by Django 2.0.5 on 2026-10-18 23:10
+
+from django.db import migrations
+
+
+def create_search_table(apps, schema_editor):
+    """FTS5 index of blog.search.SQLiteFTSBackend, filled with the existing Posts"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("CREATE VIRTUAL TABLE blog_post_fts USING fts5("
+                          "title, body, tokenize = 'unicode61 remove_diacritics 2')")
+    # ORDER BY rank sorts by BM25, with a title word weighing as much as two body words
+    schema_editor.execute("INSERT INTO blog_post_fts (blog_post_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')")
+    schema_editor.execute('INSERT INTO blog_post_fts (rowid, title, body) SELECT id, title, body FROM blog_post')
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE blog_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_trending'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
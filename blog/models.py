@@ -1,38 +1,247 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Case, Count, Exists, F, FloatField, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from blog import caching, trending
+
+
+class PostQuerySet(models.QuerySet):
+
+    def with_liked_by(self, user):
+        """Annotate every Post with `liked`: True if the user likes it"""
+        return self.annotate(liked=Exists(Like.objects.filter(post=OuterRef('pk'), user=user)))
+
+    def like_states(self, user):
+        """Return {post_id: {'liked': bool, 'like_count': int}} with one query"""
+        rows = self.with_liked_by(user).order_by().values_list('pk', 'liked', 'like_count')
+        return {pk: {'liked': liked, 'like_count': like_count} for pk, liked, like_count in rows}
+
+    def add_likes(self, user):
+        """
+        Like all Posts of the queryset by the user in one transaction.
+        Return ids of the Posts that were not liked before
+        """
+        # No savepoint: an error rolls back the transaction of the caller as well
+        with transaction.atomic(savepoint=False):
+            post_ids = list(self.with_liked_by(user).filter(liked=False).order_by()
+                            .values_list('pk', flat=True))
+            likes = [Like(user=user, post_id=pk) for pk in post_ids]
+            inserted = Like.objects.insert_ignore_conflicts(likes)
+            scored = [(like.post_id, like.created) for like in likes]
+            if inserted == len(post_ids):
+                Post.objects.filter(pk__in=post_ids).update(like_count=F('like_count') + 1)
+            else:
+                # A concurrent request liked some of them first and scored its own likes.
+                # The rows of this insert are the ones with its created times
+                Post.objects.filter(pk__in=post_ids).recount_likes()
+                stored = set(Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', 'created'))
+                scored = [like for like in scored if like in stored]
+            if post_ids:
+                PostScore.objects.record_likes(scored)
+                caching.invalidate(*post_ids)
+        return post_ids
+
+    def remove_likes(self, user):
+        """
+        Unlike all Posts of the queryset by the user in one transaction.
+        Return ids of the Posts that were liked before
+        """
+        with transaction.atomic(savepoint=False):
+            post_ids = list(self.with_liked_by(user).filter(liked=True).order_by()
+                            .values_list('pk', flat=True))
+            deleted = Like.objects.filter(user=user, post_id__in=post_ids).delete_scored()
+            if deleted == len(post_ids):
+                Post.objects.filter(pk__in=post_ids).update(like_count=F('like_count') - 1)
+            else:
+                # A concurrent request unliked some of them first
+                Post.objects.filter(pk__in=post_ids).recount_likes()
+            if post_ids:
+                caching.invalidate(*post_ids)
+        return post_ids
+
+    def recount_likes(self):
+        """Set like_count of the Posts to the number of Like rows, counted inside the UPDATE"""
+        likes = (Like.objects.filter(post=OuterRef('pk')).order_by()
+                 .values('post').annotate(count=Count('pk')).values('count'))
+        return self.update(like_count=Coalesce(Subquery(likes, output_field=IntegerField()), 0))
 
 
 class Post(models.Model):
 
     class Meta:
         verbose_name_plural = 'Posts'
-        ordering = ('-updated_at',)
+        ordering = ('-updated_at', '-id')
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='post_updated_at_id_idx'),
+            models.Index(fields=['user', 'updated_at'], name='post_user_updated_at_idx'),
+        ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=128, blank=True, null=True)
     body = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
-    @property
-    def like_count(self):
-        """Show the number of likes in the Post"""
-        return self.like_set.count()
-
     def add_like(self, user):
-        """Add like to this Post"""
-        Like.objects.get_or_create(user=user, post=self)
+        """
+        Add like to this Post. Return True if the like is new.
+        like_count is incremented in the database only if the like is new
+        """
+        with transaction.atomic():
+            like = Like(user=user, post=self)
+            created = Like.objects.insert_ignore_conflicts([like]) > 0
+            if created:
+                Post.objects.filter(pk=self.pk).update(like_count=F('like_count') + 1)
+                PostScore.objects.record_likes([(self.pk, like.created)])
+                self.like_count += 1
+                caching.invalidate(self.pk)
+        return created
 
     def unlike(self, user):
-        """Delete like to this Post"""
-        Like.objects.filter(user=user, post=self).delete()
+        """
+        Delete like to this Post. Return True if a like was deleted.
+        like_count is decremented in the database only if a like was deleted
+        """
+        with transaction.atomic():
+            deleted = Like.objects.filter(user=user, post=self).delete_scored()
+            if deleted:
+                Post.objects.filter(pk=self.pk).update(like_count=F('like_count') - deleted)
+                self.like_count -= deleted
+                caching.invalidate(self.pk)
+        return deleted > 0
+
+
+class LikeQuerySet(models.QuerySet):
+
+    def insert_ignore_conflicts(self, likes):
+        """
+        Insert likes with one statement per batch, skipping the ones
+        that already exist for the same (user, post).
+        Return the number of inserted rows
+        """
+        if not likes:
+            return 0
+        self._for_write = True
+        connection = connections[self.db]
+        fields = [self.model._meta.get_field(name) for name in ('user', 'post', 'created')]
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        table = connection.ops.quote_name(self.model._meta.db_table)
+
+        if connection.vendor == 'sqlite':
+            statement, suffix = 'INSERT OR IGNORE INTO', ''
+        elif connection.vendor == 'mysql':
+            statement, suffix = 'INSERT IGNORE INTO', ''
+        else:
+            statement, suffix = 'INSERT INTO', ' ON CONFLICT DO NOTHING'
+
+        inserted = 0
+        batch_size = max(connection.ops.bulk_batch_size(fields, likes), 1)
+        with connection.cursor() as cursor:
+            for start in range(0, len(likes), batch_size):
+                batch = likes[start:start + batch_size]
+                params = []
+                for like in batch:
+                    params.extend(field.get_db_prep_save(field.pre_save(like, add=True), connection)
+                                  for field in fields)
+                rows = ', '.join(['({})'.format(', '.join(['%s'] * len(fields)))] * len(batch))
+                cursor.execute('{} {} ({}) VALUES {}{}'.format(statement, table, columns, rows, suffix),
+                               params)
+                inserted += cursor.rowcount
+        return inserted
+
+    def delete_scored(self):
+        """Delete the likes and take them out of the trending scores. Return the number of deleted likes"""
+        likes = list(self.select_for_update().values_list('post_id', 'created'))
+        if not likes:
+            return 0
+        deleted, _ = self.delete()
+        PostScore.objects.remove_likes(likes)
+        return deleted
 
 
 class Like(models.Model):
 
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            # refresh_trending reads the recent likes from this index only
+            models.Index(fields=['created', 'post'], name='like_created_post_idx'),
+        ]
+
+    objects = LikeQuerySet.as_manager()
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
+
+
+class PostScoreQuerySet(models.QuerySet):
+
+    def record_likes(self, likes):
+        """Add likes, as (post id, created) pairs, to the scores of their Posts"""
+        values = self._sum_likes(likes)
+        if not values:
+            return
+        # Called within the transaction of the like, a savepoint would only add queries
+        with transaction.atomic(using=self.db, savepoint=False):
+            scores = dict(self.select_for_update().filter(post_id__in=values).values_list('post_id', 'score'))
+            if scores:
+                self.filter(post_id__in=scores).update(score=self._score_case({
+                    post_id: trending.logaddexp(score, values[post_id]) for post_id, score in scores.items()}))
+            self.bulk_create([PostScore(post_id=post_id, score=values[post_id])
+                              for post_id in values if post_id not in scores])
+
+    def remove_likes(self, likes, now=None):
+        """
+        Take unliked likes, as (post id, created) pairs, out of the scores of their Posts.
+        Likes made before the window are left to refresh_trending, which did not count them.
+        A Post with no like left loses its score
+        """
+        start = trending.window_start(now or timezone.now())
+        values = self._sum_likes([(post_id, created) for post_id, created in likes if created >= start])
+        if not values:
+            return
+        with transaction.atomic(using=self.db, savepoint=False):
+            scores = dict(self.select_for_update().filter(post_id__in=values).values_list('post_id', 'score'))
+            scores = {post_id: trending.logsubexp(score, values[post_id]) for post_id, score in scores.items()}
+            unliked = [post_id for post_id, score in scores.items() if score is None]
+            if unliked:
+                self.filter(post_id__in=unliked).delete()
+            scores = {post_id: score for post_id, score in scores.items() if score is not None}
+            if scores:
+                self.filter(post_id__in=scores).update(score=self._score_case(scores))
+
+    @staticmethod
+    def _sum_likes(likes):
+        """{post id: log of the sum of exp(rate * t)} over the likes of each Post"""
+        rate = trending.rate()
+        values = {}
+        for post_id, created in likes:
+            value = rate * created.timestamp()
+            values[post_id] = trending.logaddexp(values[post_id], value) if post_id in values else value
+        return values
+
+    @staticmethod
+    def _score_case(scores):
+        return Case(*[When(post_id=post_id, then=Value(score)) for post_id, score in scores.items()],
+                    output_field=FloatField())
+
+
+class PostScore(models.Model):
+    """
+    Trending score of a Post: log of the sum of exp(rate * t) over its likes,
+    with t the like time in seconds. See blog/trending.py
+    """
+
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField(db_index=True)
+
+    objects = PostScoreQuerySet.as_manager()
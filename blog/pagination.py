@@ -0,0 +1,170 @@
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from blog import timeline
+
+
+class PostCursorPagination(CursorPagination):
+    """
+    Keyset pagination for Posts on ('-updated_at', '-id').
+
+    The cursor keeps (updated_at, id) of the boundary row, so every page is
+    a range seek from that row instead of an OFFSET over all previous pages.
+    The id makes the position unique when several posts share updated_at.
+    """
+    ordering = ('-updated_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.read_cursor(request)
+        reverse = self.cursor.reverse
+
+        if reverse:
+            queryset = queryset.order_by('updated_at', 'id')
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.cursor.position is not None:
+            updated_at, pk = self.decode_position(self.cursor.position)
+            # The first filter is the index range, the second one breaks ties on id
+            if reverse:
+                queryset = queryset.filter(updated_at__gte=updated_at).filter(
+                    Q(updated_at__gt=updated_at) | Q(id__gt=pk))
+            else:
+                queryset = queryset.filter(updated_at__lte=updated_at).filter(
+                    Q(updated_at__lt=updated_at) | Q(id__lt=pk))
+
+        # Fetch one extra row to know if there is a following page
+        return self.set_page(list(queryset[:self.page_size + 1]))
+
+    def set_page(self, results):
+        """Keep the page from page_size + 1 results read in the direction of the cursor"""
+        reverse = self.cursor.reverse
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = self.cursor.position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.cursor.position is not None
+
+        return self.page
+
+    def read_cursor(self, request):
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            self.cursor = Cursor(offset=0, reverse=False, position=None)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[0], self.ordering)
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        # Posts of the list actions are rows of PostSerializer.values_queryset(), which have no pk
+        return '{}|{}'.format(instance.updated_at.isoformat(), instance.id)
+
+    def decode_position(self, position):
+        """Return (updated_at, id) stored in the cursor"""
+        updated_at, _, pk = position.rpartition('|')
+        try:
+            updated_at = parse_datetime(updated_at)
+            pk = int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if updated_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return updated_at, pk
+
+
+class TimelinePagination(PostCursorPagination):
+    """
+    PostCursorPagination over the Posts of one user. Pages within the recent
+    Posts cached by blog.timeline are fetched by id, the others are read from
+    the (user, updated_at) index
+    """
+
+    def paginate_timeline(self, queryset, user_id, request):
+        self.page_size = self.get_page_size(request)
+        self.read_cursor(request)
+        position = None
+        if self.cursor.position is not None:
+            position = self.decode_position(self.cursor.position)
+
+        ids = timeline.page(user_id, position, self.cursor.reverse, self.page_size + 1)
+        if ids is None:
+            return self.paginate_queryset(queryset.filter(user_id=user_id), request)
+        # Posts deleted without updating the timeline are skipped
+        posts = queryset.in_bulk(ids, field_name='id')
+        return self.set_page([posts[pk] for pk in ids if pk in posts])
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    Page number pagination for search results, which are ranked and have no keyset.
+    The matches are not counted: one more result is fetched to know if there is a next page
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_page_message = 'Invalid page.'
+
+    def paginate_search(self, search, request):
+        """
+        Return the ids of the page asked for by the request.
+        `search(offset, limit)` returns ids of the results, best first
+        """
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        try:
+            self.number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        if self.number < 1:
+            raise NotFound(self.invalid_page_message)
+
+        ids = search((self.number - 1) * self.page_size, self.page_size + 1)
+        self.has_next = len(ids) > self.page_size
+        return ids[:self.page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.base_url, self.page_query_param, self.number + 1)
+
+    def get_previous_link(self):
+        if self.number == 1:
+            return None
+        if self.number == 2:
+            return remove_query_param(self.base_url, self.page_query_param)
+        return replace_query_param(self.base_url, self.page_query_param, self.number - 1)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
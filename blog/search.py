@@ -0,0 +1,106 @@
+"""
+Full-text search over Post title and body.
+
+The backend is settings.POST_SEARCH_BACKEND. SQLiteFTSBackend keeps the
+title and body of every Post in the FTS5 table blog_post_fts (created by
+migration 0007) and ranks matches by BM25, a word of the title weighing
+twice as much as one of the body. Every match is ranked: BM25 has to score
+them all before the best ones are known, so a query matching most Posts
+costs a scan of its index entries. DatabaseBackend works on any database
+without an index, it scans the Post table.
+
+Posts are indexed on save and removed on delete (blog/signals.py).
+bulk_create and queryset update() send no signals: code using them indexes
+the Posts itself with get_backend().index(). `manage.py rebuild_search_index`
+indexes every Post again.
+"""
+import re
+from functools import reduce
+from operator import and_
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from blog.models import Post
+
+# Words of the query, as the unicode61 tokenizer splits them
+WORD_RE = re.compile(r'\w+')
+
+
+def query_words(query):
+    return WORD_RE.findall(query)
+
+
+class BaseBackend:
+
+    def index(self, posts):
+        """Add or replace the Posts of a queryset in the index"""
+
+    def remove(self, post_ids):
+        """Remove the Posts of the ids from the index"""
+
+    def rebuild(self):
+        """Index every Post again"""
+
+    def search(self, query, offset, limit):
+        """Ids of the Posts matching every word of the query, best match first"""
+        raise NotImplementedError
+
+
+class DatabaseBackend(BaseBackend):
+    """Search with icontains, newest first. Needs no index and scans the Post table"""
+
+    def search(self, query, offset, limit):
+        words = query_words(query)
+        if not words:
+            return []
+        match = reduce(and_, (Q(title__icontains=word) | Q(body__icontains=word) for word in words))
+        return list(Post.objects.filter(match).values_list('pk', flat=True)[offset:offset + limit])
+
+
+class SQLiteFTSBackend(BaseBackend):
+    """Search with the FTS5 table blog_post_fts, ranked by BM25"""
+    table = 'blog_post_fts'
+
+    def index(self, posts):
+        db = router.db_for_write(Post)
+        posts = posts.using(db).order_by()
+        ids_sql, ids_params = posts.values('pk').query.sql_with_params()
+        rows_sql, rows_params = posts.values_list('pk', 'title', 'body').query.sql_with_params()
+        with connections[db].cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE rowid IN ({})'.format(self.table, ids_sql), ids_params)
+            cursor.execute('INSERT INTO {} (rowid, title, body) {}'.format(self.table, rows_sql), rows_params)
+
+    def remove(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        with connections[router.db_for_write(Post)].cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE rowid IN ({})'.format(self.table, ', '.join(['%s'] * len(post_ids))),
+                           post_ids)
+
+    def rebuild(self):
+        with connections[router.db_for_write(Post)].cursor() as cursor:
+            cursor.execute('DELETE FROM {}'.format(self.table))
+        self.index(Post.objects.all())
+        with connections[router.db_for_write(Post)].cursor() as cursor:
+            # Merge the index segments, as the table was filled at once
+            cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(self.table))
+
+    def search(self, query, offset, limit):
+        words = query_words(query)
+        if not words:
+            return []
+        # Every word as an FTS5 string, so the query syntax of the client is not interpreted
+        match = ' '.join('"{}"'.format(word) for word in words)
+        # rank is bm25(2.0, 1.0), as the table has it configured
+        with connections[router.db_for_read(Post)].cursor() as cursor:
+            cursor.execute('SELECT rowid FROM {0} WHERE {0} MATCH %s '
+                           'ORDER BY rank LIMIT %s OFFSET %s'.format(self.table), [match, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+def get_backend():
+    return import_string(getattr(settings, 'POST_SEARCH_BACKEND', 'blog.search.SQLiteFTSBackend'))()
@@ -1,13 +1,128 @@
 from rest_framework import serializers
 
+from blog.export import FORMATS, TABLES
+from blog.like_buffer import overlay
 from blog.models import Post
+from blog.search import query_words
+from test_task.serialization import TimedSerializerMixin, ValuesSerializerMixin
 
 
-class PostSerializer(serializers.ModelSerializer):
-    """Serializer for Post"""
+# Maximum number of Post ids in one batch request
+MAX_BATCH_IDS = 500
+
+# Maximum number of Posts returned by trending
+MAX_TRENDING = 100
+
+# Maximum length of a search query
+MAX_SEARCH_QUERY_LENGTH = 256
+
+# Maximum number of Posts in one bulk create request, larger imports use the import_posts command
+MAX_BULK_POSTS = 5000
+
+
+class PostSerializer(TimedSerializerMixin, ValuesSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for Post.
+    Pass `fields` to return only these fields.
+    Lists are serialized from values_queryset(), which needs the queryset annotated by with_liked_by
+    """
     like_count = serializers.IntegerField(read_only=True)
+    liked_by_me = serializers.SerializerMethodField()
+
+    values_columns = {'liked_by_me': 'liked'}
 
     class Meta:
         model = Post
         fields = '__all__'
         read_only_fields = ['user', 'created_at', 'updated_at', 'like_count']
+
+    def __init__(self, *args, **kwargs):
+        self.requested_fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.requested_fields is not None:
+            for name in set(fields) - set(self.requested_fields):
+                fields.pop(name)
+        return fields
+
+    def get_values_plan_key(self):
+        if self.requested_fields is None:
+            return None
+        return frozenset(self.requested_fields)
+
+    def values_queryset(self, queryset, *columns):
+        # The like buffer overlay needs `liked` even when liked_by_me is left out
+        return super().values_queryset(queryset, 'id', 'liked', *columns)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        self.apply_pending_like(data, instance.pk, getattr(instance, 'liked', False))
+        return data
+
+    def to_representation_values(self, rows):
+        data = super().to_representation_values(rows)
+        if self.context.get('pending_likes'):
+            for row, item in zip(rows, data):
+                self.apply_pending_like(item, row.id, row.liked)
+        return data
+
+    def apply_pending_like(self, data, pk, liked):
+        """Likes of the requesting user that are still in the like buffer"""
+        pending = self.context.get('pending_likes', {}).get(pk)
+        if pending is not None:
+            if 'liked_by_me' in data:
+                data['liked_by_me'] = pending
+            if 'like_count' in data:
+                data['like_count'] = overlay(liked, data['like_count'], pending)[1]
+
+    def get_liked_by_me(self, obj):
+        """Annotated by PostQuerySet.with_liked_by. A just created Post is not liked"""
+        return getattr(obj, 'liked', False)
+
+
+class PostLikesSerializer(serializers.Serializer):
+    """Serializer for bulk like and unlike of Posts by id"""
+    like = serializers.ListField(child=serializers.IntegerField(min_value=1),
+                                 max_length=MAX_BATCH_IDS, required=False)
+    unlike = serializers.ListField(child=serializers.IntegerField(min_value=1),
+                                   max_length=MAX_BATCH_IDS, required=False)
+
+    def validate(self, attrs):
+        like, unlike = set(attrs.get('like', [])), set(attrs.get('unlike', []))
+        if not like and not unlike:
+            raise serializers.ValidationError('Provide ids to like or unlike')
+        if like & unlike:
+            raise serializers.ValidationError('Posts cannot be liked and unliked at once')
+        if len(like | unlike) > MAX_BATCH_IDS:
+            raise serializers.ValidationError(
+                'Ensure there are no more than {} ids in total'.format(MAX_BATCH_IDS))
+        return attrs
+
+
+class PostIdsSerializer(serializers.Serializer):
+    """Serializer for a list of Post ids"""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1),
+                                allow_empty=False, max_length=MAX_BATCH_IDS)
+
+
+class ExportSerializer(serializers.Serializer):
+    """Query parameters of the export. `fmt`, because DRF takes `format` for the renderer"""
+    table = serializers.ChoiceField(choices=sorted(TABLES), default='posts')
+    fmt = serializers.ChoiceField(choices=sorted(FORMATS), default='ndjson')
+
+
+class TrendingSerializer(serializers.Serializer):
+    """Query parameters of trending"""
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_TRENDING, default=20)
+
+
+class SearchSerializer(serializers.Serializer):
+    """Query parameters of search"""
+    q = serializers.CharField(max_length=MAX_SEARCH_QUERY_LENGTH)
+
+    def validate_q(self, value):
+        if not query_words(value):
+            raise serializers.ValidationError('Enter at least one word.')
+        return value
@@ -0,0 +1,20 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from blog import search
+from blog.models import Post
+
+# Saving other fields does not change the index
+INDEXED_FIELDS = {'title', 'body'}
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not INDEXED_FIELDS & set(update_fields):
+        return
+    search.get_backend().index(Post.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Post)
+def remove_deleted_post(sender, instance, **kwargs):
+    search.get_backend().remove([instance.pk])
@@ -1,21 +1,64 @@
 # created by Seredyak1
+import csv
 import json
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import timedelta
+from functools import reduce
+from io import StringIO
+from operator import itemgetter
+from unittest import mock, skipUnless
 
 from django.contrib.auth.models import User
-from django.test import Client
-
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
-from blog.models import Post
-
-
-class TestPostApi(APITestCase):
+from blog import caching, like_buffer, trending
+from blog.models import Like, LikeQuerySet, Post, PostScore
+from blog.serializers import PostSerializer
+from test_task.testing import QueryBudgetMixin
+
+# Measured queries per request of the session-authenticated test client, savepoints included
+QUERY_BUDGETS = {
+    'PostAPIView.list': 3,
+    'PostAPIView.retrieve': 4,
+    'PostAPIView.create': 5,
+    'PostAPIView.update': 6,
+    'PostAPIView.partial_update': 6,
+    'PostAPIView.destroy': 7,
+    'PostAPIView.like': 9,
+    'PostAPIView.unlike': 10,
+    'PostAPIView.likes': 16,
+    'PostAPIView.trending': 3,
+    'PostAPIView.search': 4,
+    'PostAPIView.mine': 4,
+    'PostAPIView.user_posts': 4,
+    'PostAPIView.bulk': 8,
+    'PostAPIView.export': 2,
+}
+
+
+class TestPostApi(QueryBudgetMixin, APITestCase):
     """Unit tests for Post"""
+    query_budgets = QUERY_BUDGETS
 
     def setUp(self):
         """Create client and user before every test"""
+        super().setUp()
         self.client = Client()
         self.user = User.objects.create()
+        caching.clear()
 
 # Tests for CRUDL for Post if user is owner
     def test_create_post_if_authorized(self):
@@ -192,6 +235,7 @@ class TestPostApi(APITestCase):
         add_like = self.client.post('/posts/{}/like/'.format(post.id))
 
         response = self.client.get('/posts/')
+        post.refresh_from_db()
 
         self.assertEqual(200, response.status_code)
         self.assertEqual(1, post.like_count)
@@ -204,11 +248,13 @@ class TestPostApi(APITestCase):
         add_like = self.client.post('/posts/{}/like/'.format(post.id))
 
         response = self.client.get('/posts/')
+        post.refresh_from_db()
         self.assertEqual(1, post.like_count)
 
         unlike = self.client.delete('/posts/{}/unlike/'.format(post.id))
 
         response2 = self.client.get('/posts/')
+        post.refresh_from_db()
 
         self.assertEqual(0, post.like_count)
 
@@ -225,6 +271,915 @@ class TestPostApi(APITestCase):
         add_like_by_second_user = self.client.post('/posts/{}/like/'.format(post.id))
 
         response = self.client.get('/posts/')
+        post.refresh_from_db()
 
         self.assertEqual(200, response.status_code)
         self.assertEqual(2, post.like_count)
+
+    def test_like_post_twice_counts_once(self):
+        """Repeated like and unlike change like_count only once"""
+        self.test_create_post_if_authorized()
+        post = Post.objects.first()
+
+        self.client.post('/posts/{}/like/'.format(post.id))
+        self.client.post('/posts/{}/like/'.format(post.id))
+        post.refresh_from_db()
+        self.assertEqual(1, post.like_count)
+
+        self.client.delete('/posts/{}/unlike/'.format(post.id))
+        self.client.delete('/posts/{}/unlike/'.format(post.id))
+        post.refresh_from_db()
+        self.assertEqual(0, post.like_count)
+
+    def test_like_and_unlike_return_like_state(self):
+        """Like is 201 once, then 200. Both return liked and like_count"""
+        self.test_create_post_if_authorized()
+        post = Post.objects.first()
+
+        response = self.client.post('/posts/{}/like/'.format(post.id))
+        self.assertEqual(201, response.status_code)
+        self.assertEqual({'liked': True, 'like_count': 1}, response.data)
+
+        response = self.client.post('/posts/{}/like/'.format(post.id))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'liked': True, 'like_count': 1}, response.data)
+
+        response = self.client.delete('/posts/{}/unlike/'.format(post.id))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'liked': False, 'like_count': 0}, response.data)
+
+        response = self.client.delete('/posts/{}/unlike/'.format(post.id))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'liked': False, 'like_count': 0}, response.data)
+
+    def test_like_does_not_load_post_body(self):
+        """Like loads only id and like_count, and writes with one INSERT and one UPDATE"""
+        self.test_create_post_if_authorized()
+        post = Post.objects.first()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post('/posts/{}/like/'.format(post.id))
+
+        post_selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and '"blog_post"' in q['sql']]
+        self.assertEqual(1, len(post_selects))
+        self.assertNotIn('body', post_selects[0])
+        self.assertEqual(1, len([q for q in queries if 'INTO "blog_like"' in q['sql']]))
+        self.assertEqual(1, len([q for q in queries if q['sql'].startswith('UPDATE "blog_post"')]))
+
+    def test_like_not_existing_post(self):
+        """Assert 404 status code was returned"""
+        self.client.force_login(self.user)
+
+        response = self.client.post('/posts/100/like/')
+
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(0, Like.objects.count())
+
+    def test_bulk_like_and_unlike(self):
+        """Like and unlike many Posts in one request, response has their new state"""
+        self.client.force_login(self.user)
+        posts = [Post.objects.create(user=self.user, title='Title {}'.format(i)) for i in range(4)]
+        posts[0].add_like(self.user)
+        posts[1].add_like(self.user)
+
+        response = self.client.post('/posts/likes/',
+                                    data=json.dumps({'like': [posts[1].id, posts[2].id, posts[3].id],
+                                                     'unlike': [posts[0].id]}),
+                                    content_type='application/json')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({posts[0].id: {'liked': False, 'like_count': 0},
+                          posts[1].id: {'liked': True, 'like_count': 1},
+                          posts[2].id: {'liked': True, 'like_count': 1},
+                          posts[3].id: {'liked': True, 'like_count': 1}}, response.data)
+        self.assertEqual(3, Like.objects.filter(user=self.user).count())
+
+    def test_bulk_like_with_wrong_data(self):
+        """Assert 400 status code for empty, overlapping or too long id lists"""
+        self.client.force_login(self.user)
+
+        for data in ({}, {'like': [1], 'unlike': [1]}, {'like': list(range(1, 502))}):
+            response = self.client.post('/posts/likes/', data=json.dumps(data),
+                                        content_type='application/json')
+            self.assertEqual(400, response.status_code)
+
+    def test_get_like_states_has_constant_number_of_queries(self):
+        """State of any number of Posts is returned with the same number of queries"""
+        self.client.force_login(self.user)
+        second_user = User.objects.create(username='second_user')
+        posts = [Post.objects.create(user=self.user, title='Title {}'.format(i)) for i in range(6)]
+        posts[0].add_like(self.user)
+        posts[0].add_like(second_user)
+        posts[1].add_like(second_user)
+
+        with CaptureQueriesContext(connection) as one_post:
+            self.client.get('/posts/likes/', {'ids': str(posts[0].id)})
+        with self.assertNumQueries(len(one_post)):
+            response = self.client.get('/posts/likes/', {'ids': ','.join(str(post.id) for post in posts)})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'liked': True, 'like_count': 2}, response.data[posts[0].id])
+        self.assertEqual({'liked': False, 'like_count': 1}, response.data[posts[1].id])
+        self.assertEqual({'liked': False, 'like_count': 0}, response.data[posts[5].id])
+
+    def test_sync_like_counts_command(self):
+        """Drifted like_count is fixed by the sync_like_counts command"""
+        self.test_like_post_by_2_users()
+        post = Post.objects.first()
+        other_post = Post.objects.create(user=self.user, title='Other title')
+        Post.objects.update(like_count=7)
+
+        out = StringIO()
+        call_command('sync_like_counts', batch_size=1, stdout=out)
+
+        self.assertEqual(2, Post.objects.get(pk=post.pk).like_count)
+        self.assertEqual(0, Post.objects.get(pk=other_post.pk).like_count)
+        self.assertIn('fixed 2', out.getvalue())
+
+# Test trending
+    def test_trending_ranks_recent_likes_first(self):
+        """2 likes today rank above 3 likes 3 days ago. New likes are scored as they come"""
+        users = [User.objects.create(username='user_{}'.format(i)) for i in range(3)]
+        recent, old, new = [Post.objects.create(user=self.user, title=title) for title in ('recent', 'old', 'new')]
+        for user in users[:2]:
+            recent.add_like(user)
+        for user in users:
+            old.add_like(user)
+        Like.objects.filter(post=old).update(created=F('created') - timedelta(days=3))
+        call_command('refresh_trending', stdout=StringIO())
+        self.client.force_login(self.user)
+
+        response = self.client.get('/posts/trending/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['recent', 'old'], [post['title'] for post in response.data])
+        self.assertNotIn('body', response.data[0])
+
+        self.client.post('/posts/{}/like/'.format(new.id))
+        response = self.client.get('/posts/trending/', {'limit': 2})
+        self.assertEqual(['recent', 'new'], [post['title'] for post in response.data])
+
+    def test_trending_after_like_and_unlike(self):
+        """Liking and unliking again leaves the ranking and the scores as they were"""
+        users = [User.objects.create(username='user_{}'.format(i)) for i in range(2)]
+        popular, toggled = [Post.objects.create(user=self.user, title=title) for title in ('popular', 'toggled')]
+        for user in users:
+            popular.add_like(user)
+        toggled.add_like(users[0])
+        self.client.force_login(self.user)
+
+        for _ in range(5):
+            self.client.post('/posts/{}/like/'.format(toggled.id))
+            self.client.delete('/posts/{}/unlike/'.format(toggled.id))
+        Post.objects.filter(pk=popular.pk).remove_likes(users[1])
+        Post.objects.filter(pk=popular.pk).add_likes(users[1])
+
+        response = self.client.get('/posts/trending/')
+        self.assertEqual(['popular', 'toggled'], [post['title'] for post in response.data])
+        for post in (popular, toggled):
+            values = [trending.rate() * created.timestamp()
+                      for created in Like.objects.filter(post=post).values_list('created', flat=True)]
+            self.assertAlmostEqual(reduce(trending.logaddexp, values), PostScore.objects.get(post=post).score, places=6)
+
+        Post.objects.get(pk=toggled.pk).unlike(users[0])
+        response = self.client.get('/posts/trending/')
+        self.assertEqual(['popular'], [post['title'] for post in response.data])
+
+    def test_add_likes_scores_only_inserted_likes(self):
+        """A like inserted by a concurrent request first is scored by that request only"""
+        posts = [Post.objects.create(user=self.user, title=title) for title in ('first', 'second')]
+        insert = LikeQuerySet.insert_ignore_conflicts
+
+        def insert_after_concurrent_like(queryset, likes):
+            concurrent = Like(user=self.user, post=posts[0])
+            insert(queryset, [concurrent])
+            PostScore.objects.record_likes([(concurrent.post_id, concurrent.created)])
+            return insert(queryset, likes)
+
+        with mock.patch.object(LikeQuerySet, 'insert_ignore_conflicts', insert_after_concurrent_like):
+            Post.objects.filter(pk__in=[post.pk for post in posts]).add_likes(self.user)
+
+        for post in posts:
+            created = Like.objects.get(post=post).created
+            self.assertAlmostEqual(trending.rate() * created.timestamp(), PostScore.objects.get(post=post).score,
+                                   places=6)
+            post.refresh_from_db()
+            self.assertEqual(1, post.like_count)
+
+    def test_refresh_trending_drops_old_likes(self):
+        """A Post liked before the window loses its score at the refresh"""
+        post = Post.objects.create(user=self.user, title='Title')
+        post.add_like(self.user)
+        Like.objects.update(created=F('created') - timedelta(days=30))
+
+        out = StringIO()
+        call_command('refresh_trending', stdout=out)
+
+        self.assertFalse(PostScore.objects.exists())
+        self.assertIn('Scored 0 posts from 0 likes', out.getvalue())
+
+# Test search
+    def test_search_ranks_title_matches_first(self):
+        """Posts with every word are returned, a match in the title before a match in the body"""
+        Post.objects.create(user=self.user, title='Cooking', body='Fast python recipes')
+        Post.objects.create(user=self.user, title='Python recipes', body='Cooking')
+        Post.objects.create(user=self.user, title='Python', body='Nothing else')
+        self.client.force_login(self.user)
+
+        response = self.client.get('/posts/search/', {'q': 'python recipes'})
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['Python recipes', 'Cooking'], [post['title'] for post in response.data['results']])
+        self.assertNotIn('body', response.data['results'][0])
+
+    def test_search_index_follows_saves_and_deletes(self):
+        """Updated and deleted Posts are found by their new words only"""
+        self.client.force_login(self.user)
+        self.client.post('/posts/', data={'title': 'Old words'})
+        post = Post.objects.get()
+
+        self.client.patch('/posts/{}/'.format(post.id), data=json.dumps({'title': 'New words'}),
+                          content_type='application/json')
+        self.assertEqual([], self.client.get('/posts/search/', {'q': 'old'}).data['results'])
+        self.assertEqual([post.id], [p['id'] for p in self.client.get('/posts/search/', {'q': 'new'}).data['results']])
+
+        self.client.delete('/posts/{}/'.format(post.id))
+        self.assertEqual([], self.client.get('/posts/search/', {'q': 'new'}).data['results'])
+
+    def test_search_is_paginated(self):
+        """Pages follow each other with next and previous links"""
+        for i in range(5):
+            Post.objects.create(user=self.user, title='Word {}'.format(i))
+        self.client.force_login(self.user)
+
+        first = self.client.get('/posts/search/', {'q': 'word', 'page_size': 2})
+        second = self.client.get(first.data['next'])
+        last = self.client.get(second.data['next'])
+
+        self.assertIsNone(first.data['previous'])
+        self.assertIsNone(last.data['next'])
+        self.assertEqual(200, self.client.get(second.data['previous']).status_code)
+        ids = [post['id'] for page in (first, second, last) for post in page.data['results']]
+        self.assertEqual(sorted(Post.objects.values_list('id', flat=True)), sorted(ids))
+        self.assertEqual(404, self.client.get('/posts/search/', {'q': 'word', 'page': 0}).status_code)
+
+    def test_search_query_syntax_is_not_interpreted(self):
+        """Quotes and operators of the query are ignored, a query without words is invalid"""
+        Post.objects.create(user=self.user, title='Apples and pears')
+        self.client.force_login(self.user)
+
+        response = self.client.get('/posts/search/', {'q': '"apples" OR NOT* pears)'})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([], response.data['results'])
+        self.assertEqual(1, len(self.client.get('/posts/search/', {'q': '"apples" pears)'}).data['results']))
+        self.assertEqual(400, self.client.get('/posts/search/', {'q': '"*'}).status_code)
+
+    def test_search_ranks_every_match(self):
+        """The best match comes first however many newer matches there are"""
+        best = Post.objects.create(user=self.user, title='Word word word')
+        for i in range(5):
+            Post.objects.create(user=self.user, body='Word {}'.format(i))
+        self.client.force_login(self.user)
+
+        response = self.client.get('/posts/search/', {'q': 'word', 'page_size': 2})
+
+        self.assertEqual(best.id, response.data['results'][0]['id'])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_bulk_created_posts_are_searchable(self):
+        """bulk_create sends no signal, the import indexes the new Posts itself"""
+        self.client.force_login(self.user)
+        rows = [{'title': 'Imported {}'.format(i)} for i in range(3)]
+        self.client.post('/posts/bulk/', data=json.dumps(rows), content_type='application/json')
+
+        response = self.client.get('/posts/search/', {'q': 'imported'})
+
+        self.assertEqual(3, len(response.data['results']))
+
+    def test_rebuild_search_index_command(self):
+        """Posts missing from the index are indexed again"""
+        Post.objects.bulk_create([Post(user=self.user, title='Not indexed')])
+        self.client.force_login(self.user)
+        self.assertEqual([], self.client.get('/posts/search/', {'q': 'indexed'}).data['results'])
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+
+        self.assertEqual(1, len(self.client.get('/posts/search/', {'q': 'indexed'}).data['results']))
+        self.assertIn('Indexed 1 posts', out.getvalue())
+
+# Test bulk import
+    def test_bulk_create_posts(self):
+        """Assert valid rows are created for auth user and the others are returned with their index"""
+        self.client.force_login(self.user)
+        self.client.get('/posts/')
+        rows = [{'title': 'Title 1', 'body': 'Body 1'}, {'title': 'x' * 200}, 'not a post', {'title': 'Title 2'}]
+
+        response = self.client.post('/posts/bulk/', data=json.dumps(rows), content_type='application/json')
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(2, response.data['created'])
+        self.assertEqual([1, 2], [error['index'] for error in response.data['errors']])
+        self.assertIn('title', response.data['errors'][0]['errors'])
+        self.assertEqual(['Title 1', 'Title 2'], sorted(Post.objects.filter(user=self.user)
+                                                        .values_list('title', flat=True)))
+        response = self.client.get('/posts/')
+        self.assertEqual(2, len(response.data['results']))
+
+    def test_bulk_create_no_posts(self):
+        """Assert a 200 status code with nothing created for an empty list and for invalid rows"""
+        self.client.force_login(self.user)
+
+        response = self.client.post('/posts/bulk/', data='[]', content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'created': 0, 'errors': []}, response.data)
+
+        response = self.client.post('/posts/bulk/', data='["not a post"]', content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([0], [error['index'] for error in response.data['errors']])
+
+        response = self.client.post('/posts/bulk/', data='{"title": "Title"}', content_type='application/json')
+        self.assertEqual(400, response.status_code)
+
+    def test_bulk_create_posts_queries_per_batch(self):
+        """Assert the number of queries does not grow with the number of rows"""
+        self.client.force_login(self.user)
+        rows = [{'title': 'Title {}'.format(i)} for i in range(40)]
+
+        with CaptureQueriesContext(connection) as few:
+            self.client.post('/posts/bulk/', data=json.dumps(rows[:5]), content_type='application/json')
+        with self.assertNumQueries(len(few)):
+            response = self.client.post('/posts/bulk/', data=json.dumps(rows), content_type='application/json')
+
+        self.assertEqual(40, response.data['created'])
+        self.assertEqual(45, Post.objects.count())
+
+    def test_import_posts_command(self):
+        """Assert posts from an NDJSON file are created in batches, skipping invalid rows"""
+        self.user.username = 'author'
+        self.user.save()
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as ndjson:
+            for i in range(5):
+                ndjson.write(json.dumps({'title': 'Title {}'.format(i)}) + '\n')
+            ndjson.write(json.dumps({'title': 'x' * 200}) + '\n')
+        self.addCleanup(os.remove, ndjson.name)
+        out, err = StringIO(), StringIO()
+
+        call_command('import_posts', ndjson.name, '--user', 'author', batch_size=2, stdout=out, stderr=err)
+
+        self.assertIn('Created 5 posts, skipped 1', out.getvalue())
+        self.assertIn('Line 6:', err.getvalue())
+        self.assertEqual(5, Post.objects.filter(user=self.user).count())
+
+    def test_import_posts_command_skips_bad_lines(self):
+        """Assert blank lines are skipped and lines that are not JSON are reported, the others imported"""
+        self.user.username = 'author'
+        self.user.save()
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as ndjson:
+            ndjson.write('{"title": "Title 1"}\n\n{"title": \n{"title": "Title 2"}\n')
+            ndjson.write(json.dumps({'title': 'x' * 200}) + '\n')
+        self.addCleanup(os.remove, ndjson.name)
+        out, err = StringIO(), StringIO()
+
+        call_command('import_posts', ndjson.name, '--user', 'author', batch_size=2, stdout=out, stderr=err)
+
+        self.assertIn('Created 2 posts, skipped 2', out.getvalue())
+        errors = err.getvalue().splitlines()
+        self.assertEqual(['Line 3', 'Line 5'], [line.split(':')[0] for line in errors])
+        self.assertIn('Invalid JSON', errors[0])
+        self.assertIn('"title"', errors[1])
+
+# Test streaming export
+    def get_export(self, **params):
+        response = self.client.get('/posts/export/', params)
+        self.assertEqual(200, response.status_code)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_posts_and_likes(self):
+        """Assert every row is exported as NDJSON and as CSV, across chunks"""
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        posts = [Post.objects.create(user=self.user, title='Title {}'.format(i), body='Body, "quoted"\n')
+                 for i in range(3)]
+        posts[1].add_like(self.user)
+
+        rows = [json.loads(line) for line in self.get_export().splitlines()]
+        self.assertEqual([post.id for post in posts], [row['id'] for row in rows])
+        self.assertEqual('Body, "quoted"\n', rows[0]['body'])
+        self.assertEqual(1, rows[1]['like_count'])
+
+        rows = list(csv.DictReader(self.get_export(fmt='csv').splitlines(keepends=True)))
+        self.assertEqual([str(post.id) for post in posts], [row['id'] for row in rows])
+        self.assertEqual('Body, "quoted"\n', rows[2]['body'])
+
+        rows = list(csv.DictReader(self.get_export(table='likes', fmt='csv').splitlines()))
+        self.assertEqual([str(posts[1].id)], [row['post_id'] for row in rows])
+
+    def test_export_is_not_admin(self):
+        """Assert a 403 status code for a user who is not staff, 400 for an unknown table"""
+        self.client.force_login(self.user)
+
+        response = self.client.get('/posts/export/')
+        self.assertEqual(403, response.status_code)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/posts/export/', {'table': 'auth_user'})
+        self.assertEqual(400, response.status_code)
+
+    def test_export_memory_is_bounded(self):
+        """Peak memory while streaming does not grow with the number of rows"""
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+
+        def peak_of_export(count):
+            Post.objects.bulk_create(Post(user=self.user, title='Title', body='x' * 1000)
+                                     for _ in range(count - Post.objects.count()))
+            tracemalloc.start()
+            try:
+                size = sum(len(piece) for piece in self.client.get('/posts/export/').streaming_content)
+                return size, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        small_size, small_peak = peak_of_export(2000)
+        large_size, large_peak = peak_of_export(8000)
+
+        self.assertGreater(large_size, 4 * small_size * 0.9)
+        self.assertLess(large_peak, large_size)
+        self.assertLess(large_peak, small_peak * 1.25)
+
+    def test_export_table_command(self):
+        """Assert the export_table command writes the same rows as the endpoint"""
+        post = Post.objects.create(user=self.user, title='Title')
+
+        out = StringIO()
+        call_command('export_table', 'posts', chunk_size=1, stdout=out)
+
+        self.assertEqual([post.id], [json.loads(line)['id'] for line in out.getvalue().splitlines()])
+
+# Test number of queries for list of posts
+    def test_list_of_posts_has_constant_number_of_queries(self):
+        """Number of queries does not depend on the number of posts in the list"""
+        self.test_add_like_to_post()
+        caching.clear()
+
+        with CaptureQueriesContext(connection) as one_post:
+            response = self.client.get('/posts/')
+        self.assertEqual(1, response.data['results'][0]['like_count'])
+
+        for i in range(5):
+            post = Post.objects.create(user=self.user, title='Title {}'.format(i))
+            post.add_like(self.user)
+
+        with self.assertNumQueries(len(one_post)):
+            response = self.client.get('/posts/')
+
+        self.assertEqual(6, len(response.data['results']))
+        self.assertEqual([1] * 6, [item['like_count'] for item in response.data['results']])
+
+    def test_liked_by_me_depends_on_requesting_user(self):
+        """liked_by_me is True only for Posts liked by the requesting user"""
+        self.client.force_login(self.user)
+        second_user = User.objects.create(username='second_user')
+        liked = Post.objects.create(user=self.user, title='Liked title')
+        not_liked = Post.objects.create(user=self.user, title='Not liked title')
+        liked.add_like(self.user)
+        not_liked.add_like(second_user)
+
+        response = self.client.get('/posts/')
+        liked_by_me = {item['id']: item['liked_by_me'] for item in response.data['results']}
+        self.assertEqual({liked.id: True, not_liked.id: False}, liked_by_me)
+
+        response = self.client.get('/posts/{}/'.format(liked.id))
+        self.assertEqual(True, response.data['liked_by_me'])
+
+        response = self.client.post('/posts/', data={'title': 'New title'})
+        self.assertEqual(False, response.data['liked_by_me'])
+
+# Test cache of list and detail responses
+    def test_list_and_detail_are_served_from_cache(self):
+        """Second read is a cache hit and does not load Posts"""
+        self.test_create_post_if_authorized()
+        post = Post.objects.first()
+
+        for url in ('/posts/', '/posts/{}/'.format(post.id)):
+            first = self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                second = self.client.get(url)
+
+            self.assertEqual(first.data, second.data)
+            self.assertFalse([q for q in queries if '"blog_post"."body"' in q['sql']])
+        self.assertEqual({'hits': 2, 'misses': 2}, caching.stats())
+
+    def test_cache_is_invalidated_by_writes(self):
+        """Update, like, unlike and delete are visible in the next read"""
+        self.test_create_post_if_authorized()
+        post = Post.objects.first()
+        detail = '/posts/{}/'.format(post.id)
+        self.client.get('/posts/')
+        self.client.get(detail)
+
+        self.client.patch(detail, data=json.dumps({'title': 'Patched title'}),
+                          content_type='application/json')
+        self.assertEqual('Patched title', self.client.get(detail).data['title'])
+        self.assertEqual('Patched title', self.client.get('/posts/').data['results'][0]['title'])
+
+        self.client.post('/posts/{}/like/'.format(post.id))
+        self.assertEqual(1, self.client.get(detail).data['like_count'])
+        self.assertEqual(1, self.client.get('/posts/').data['results'][0]['like_count'])
+
+        self.client.post('/posts/likes/', data=json.dumps({'unlike': [post.id]}),
+                         content_type='application/json')
+        self.assertEqual(0, self.client.get(detail).data['like_count'])
+
+        self.client.delete(detail)
+        self.assertEqual(404, self.client.get(detail).status_code)
+        self.assertEqual([], self.client.get('/posts/').data['results'])
+
+    def test_cache_is_per_user(self):
+        """liked_by_me of one user is not served to another one"""
+        self.test_add_like_to_post()
+        post = Post.objects.first()
+        self.assertEqual(True, self.client.get('/posts/{}/'.format(post.id)).data['liked_by_me'])
+
+        self.client.force_login(User.objects.create(username='second_user'))
+
+        self.assertEqual(False, self.client.get('/posts/{}/'.format(post.id)).data['liked_by_me'])
+
+# Test author timelines
+    def test_user_posts_are_paginated_newest_first(self):
+        """Only the Posts of the user, in pages linked by cursors, beyond the cached ids too"""
+        other = User.objects.create(username='other')
+        posts = [Post.objects.create(user=self.user, title='Title {}'.format(i)).id for i in range(5)]
+        Post.objects.create(user=other, title='Other')
+        self.client.force_login(other)
+        url = '/users/{}/posts/'.format(self.user.id)
+
+        for timeline_size in (100, 2):
+            with self.subTest(timeline_size=timeline_size), override_settings(POST_TIMELINE_SIZE=timeline_size):
+                caching.clear()
+                pages = [self.client.get(url, {'page_size': 2})]
+                while pages[-1].data['next']:
+                    pages.append(self.client.get(pages[-1].data['next']))
+
+                self.assertEqual(posts[::-1], [post['id'] for page in pages for post in page.data['results']])
+                self.assertNotIn('body', pages[0].data['results'][0])
+                previous = self.client.get(pages[-1].data['previous'])
+                self.assertEqual(posts[2:0:-1], [post['id'] for post in previous.data['results']])
+
+    def test_my_posts(self):
+        """/posts/mine/ returns the Posts of auth user"""
+        self.client.force_login(self.user)
+        self.client.post('/posts/', data={'title': 'Mine'})
+        Post.objects.create(user=User.objects.create(username='other'), title='Not mine')
+
+        response = self.client.get('/posts/mine/')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['Mine'], [post['title'] for post in response.data['results']])
+
+    def test_user_posts_of_missing_user(self):
+        """404 for a user that does not exist, an empty page for one without Posts"""
+        self.client.force_login(self.user)
+
+        self.assertEqual(404, self.client.get('/users/{}/posts/'.format(self.user.id + 1)).status_code)
+        self.assertEqual([], self.client.get('/users/{}/posts/'.format(self.user.id)).data['results'])
+
+    def test_timeline_is_read_by_cached_ids(self):
+        """Once cached, a timeline page is one id__in query, kept up to date by create, update and delete"""
+        self.client.force_login(self.user)
+        first, second = [self.client.post('/posts/', data={'title': title}).data['id'] for title in ('1', '2')]
+        url = '/users/{}/posts/'.format(self.user.id)
+        self.client.get(url)
+
+        def timeline():
+            with CaptureQueriesContext(connection) as queries:
+                ids = [post['id'] for post in self.client.get(url).data['results']]
+            post_queries = [q['sql'] for q in queries if '"blog_post"' in q['sql']]
+            self.assertEqual(1, len(post_queries))
+            self.assertIn('"blog_post"."id" IN (', post_queries[0])
+            return ids
+
+        self.assertEqual([second, first], timeline())
+        third = self.client.post('/posts/', data={'title': '3'}).data['id']
+        self.assertEqual([third, second, first], timeline())
+        self.client.patch('/posts/{}/'.format(first), data=json.dumps({'title': '1 again'}),
+                          content_type='application/json')
+        self.assertEqual([first, third, second], timeline())
+        self.client.delete('/posts/{}/'.format(third))
+        self.assertEqual([first, second], timeline())
+
+# Test conditional GET of a post
+    def test_get_post_with_if_none_match(self):
+        """304 for the current ETag without loading the Post, 200 after a like"""
+        self.test_create_post_if_authorized()
+        post = Post.objects.first()
+        url = '/posts/{}/'.format(post.id)
+
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.content)
+        self.assertFalse([q for q in queries if '"blog_post"."body"' in q['sql']])
+
+        self.client.post('/posts/{}/like/'.format(post.id))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_get_post_after_like_of_other_user(self):
+        """A like of another user does not change updated_at, conditional GET still returns 200"""
+        self.test_create_post_if_authorized()
+        post = Post.objects.first()
+        url = '/posts/{}/'.format(post.id)
+        self.client.get(url)
+
+        Post.objects.get(pk=post.pk).add_like(User.objects.create(username='other'))
+
+        # Later than updated_at, as a client would send it
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.data['like_count'])
+
+# Test sparse fieldsets
+    def test_list_of_posts_without_body(self):
+        """List leaves body out and does not SELECT it"""
+        self.test_create_post_if_authorized()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/posts/')
+
+        self.assertNotIn('body', response.data['results'][0])
+        self.assertIn('title', response.data['results'][0])
+        self.assertFalse([q for q in queries if '"blog_post"."body"' in q['sql']])
+
+    def test_get_posts_with_fields(self):
+        """Only the fields from ?fields= are returned, body is there if asked for"""
+        self.test_create_post_if_authorized()
+        post = Post.objects.first()
+
+        response = self.client.get('/posts/', {'fields': 'id,body,like_count'})
+        self.assertEqual([{'id': post.id, 'like_count': 0, 'body': 'Test body'}],
+                         [dict(item) for item in response.data['results']])
+
+        response = self.client.get('/posts/{}/'.format(post.id), {'fields': 'title'})
+        self.assertEqual({'title': 'Test title'}, response.data)
+
+    def test_get_posts_with_unknown_fields(self):
+        """Assert 400 status code for a field that does not exist"""
+        self.client.force_login(self.user)
+
+        response = self.client.get('/posts/', {'fields': 'id,password'})
+
+        self.assertEqual(400, response.status_code)
+
+    def test_list_responses_have_the_bytes_of_the_serializer(self):
+        """Lists serialized from rows render as PostSerializer.data of the instances did"""
+        self.client.force_login(self.user)
+        titles = ['Line\u2028separator\u2029', 'Caf\u00e9 \u2603 "quoted" \\ \x01', None, '']
+        for title in titles:
+            Post.objects.create(user=self.user, title=title, body='Body of {}'.format(title))
+        Post.objects.filter(title='').update(updated_at=F('updated_at') - timedelta(microseconds=1))
+        Post.objects.filter(title__isnull=True).update(created_at=timezone.now().replace(microsecond=0))
+        Post.objects.first().add_like(self.user)
+        posts = Post.objects.with_liked_by(self.user).order_by('-updated_at', '-id')
+
+        for fields in [None, 'id,title', 'body,liked_by_me,user,created_at,updated_at,like_count']:
+            response = self.client.get('/posts/', {'fields': fields} if fields else {})
+            serializer = PostSerializer(posts, many=True, fields=fields.split(',') if fields else
+                                        [name for name in PostSerializer().fields if name != 'body'])
+            expected = OrderedDict([('next', None), ('previous', None), ('results', serializer.data)])
+            self.assertEqual(JSONRenderer().render(expected), response.content)
+        self.assertIn(b'Line\\u2028separator\\u2029', response.content)
+
+        with timezone.override('Asia/Kolkata'):
+            serializer = PostSerializer()
+            rows = list(serializer.values_queryset(posts))
+            self.assertEqual(PostSerializer(posts, many=True).data, serializer.to_representation_values(rows))
+            self.assertTrue(serializer.to_representation_values(rows)[0]['created_at'].endswith('+05:30'))
+
+# Test cursor pagination for list of posts
+    def test_list_of_posts_is_paginated_by_cursor(self):
+        """Walk all pages forward and back, posts with the same updated_at are not lost"""
+        self.client.force_login(self.user)
+        for i in range(7):
+            Post.objects.create(user=self.user, title='Title {}'.format(i))
+        same_time = Post.objects.order_by('id')[3].updated_at
+        Post.objects.filter(id__in=Post.objects.order_by('id').values('id')[2:5]).update(updated_at=same_time)
+        expected = list(Post.objects.order_by('-updated_at', '-id').values_list('id', flat=True))
+
+        pages = []
+        response = self.client.get('/posts/', {'page_size': 3})
+        self.assertIsNone(response.data['previous'])
+        while True:
+            pages.append([item['id'] for item in response.data['results']])
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual([3, 3, 1], [len(page) for page in pages])
+        self.assertEqual(expected, sum(pages, []))
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(pages[1], [item['id'] for item in response.data['results']])
+
+    def test_list_of_posts_with_invalid_cursor(self):
+        """Assert 404 status code for a broken cursor"""
+        self.client.force_login(self.user)
+
+        response = self.client.get('/posts/', {'cursor': 'broken'})
+
+        self.assertEqual(404, response.status_code)
+
+
+@override_settings(LIKE_WRITE_BEHIND=True, LIKE_BUFFER_FLUSH_SECONDS=3600)
+class TestLikeBuffer(QueryBudgetMixin, APITestCase):
+    """Unit tests for likes written behind. The buffer is flushed by the test"""
+    # Like requests touch the buffer only
+    query_budgets = dict(QUERY_BUDGETS, **{'PostAPIView.like': 3, 'PostAPIView.unlike': 3, 'PostAPIView.likes': 3})
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.user = User.objects.create(username='liker')
+        self.other_user = User.objects.create(username='other')
+        self.post = Post.objects.create(user=self.other_user, title='Title')
+        self.buffer = like_buffer.get_buffer()
+        self.addCleanup(self.buffer.flush)
+        caching.clear()
+
+    def get_post(self, user):
+        self.client.force_login(user)
+        return self.client.get('/posts/{}/'.format(self.post.id)).data
+
+    def test_like_is_written_on_flush(self):
+        """The liker sees the like at once, other users after the flush"""
+        self.client.force_login(self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/posts/{}/like/'.format(self.post.id))
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual({'liked': True, 'like_count': 1}, response.data)
+        self.assertFalse([q for q in queries if 'blog_like"' in q['sql'] and not q['sql'].startswith('SELECT')])
+        self.assertEqual((True, 1), itemgetter('liked_by_me', 'like_count')(self.get_post(self.user)))
+        self.assertEqual(0, self.get_post(self.other_user)['like_count'])
+
+        self.buffer.flush()
+
+        self.assertEqual(1, Like.objects.filter(user=self.user, post=self.post).count())
+        self.assertEqual(1, Post.objects.get(pk=self.post.pk).like_count)
+        self.assertEqual(1, self.get_post(self.other_user)['like_count'])
+
+    def test_likes_and_unlikes_are_coalesced(self):
+        """Like, unlike and like again is one INSERT. Unlike of a stored like deletes it"""
+        other_post = Post.objects.create(user=self.other_user, title='Other title')
+        other_post.add_like(self.user)
+        self.client.force_login(self.user)
+
+        self.client.post('/posts/{}/like/'.format(self.post.id))
+        self.client.delete('/posts/{}/unlike/'.format(self.post.id))
+        response = self.client.post('/posts/{}/like/'.format(self.post.id))
+        self.assertEqual(201, response.status_code)
+        response = self.client.delete('/posts/{}/unlike/'.format(other_post.id))
+        self.assertEqual({'liked': False, 'like_count': 0}, response.data)
+
+        self.buffer.flush()
+
+        self.assertEqual([self.post.id], list(Like.objects.filter(user=self.user).values_list('post_id', flat=True)))
+        self.assertEqual({self.post.id: 1, other_post.id: 0}, dict(Post.objects.values_list('id', 'like_count')))
+
+    def test_list_shows_buffered_likes(self):
+        """The liker sees the buffered like in lists too"""
+        self.client.force_login(self.user)
+        self.client.post('/posts/{}/like/'.format(self.post.id))
+
+        response = self.client.get('/posts/')
+
+        self.assertEqual([(True, 1)], [itemgetter('liked_by_me', 'like_count')(item)
+                                       for item in response.data['results']])
+        response = self.client.get('/posts/', {'fields': 'like_count'})
+        self.assertEqual([{'like_count': 1}], response.data['results'])
+
+    def test_bulk_likes_are_buffered(self):
+        """Bulk like returns the buffered state and writes it on flush"""
+        self.client.force_login(self.user)
+
+        response = self.client.post('/posts/likes/', data=json.dumps({'like': [self.post.id]}),
+                                    content_type='application/json')
+
+        self.assertEqual({self.post.id: {'liked': True, 'like_count': 1}}, response.data)
+        self.assertEqual(0, Like.objects.count())
+        self.buffer.flush()
+        self.assertEqual(1, Like.objects.count())
+
+    @override_settings(LIKE_BUFFER_MAX_RETRIES=1)
+    def test_failed_flush_is_retried(self):
+        """A batch failing to write is kept for the next flush, and dropped after LIKE_BUFFER_MAX_RETRIES"""
+        self.buffer.add(self.user.pk, [self.post.pk], True)
+
+        with mock.patch('blog.like_buffer.write', side_effect=ValueError), self.assertLogs('blog.like_buffer'):
+            self.buffer.flush()
+        self.assertEqual({self.post.pk: True}, self.buffer.pending_for_user(self.user.pk))
+        self.buffer.flush()
+        self.assertEqual(1, Post.objects.get(pk=self.post.pk).like_count)
+
+        self.buffer.add(self.user.pk, [self.post.pk], False)
+        with mock.patch('blog.like_buffer.write', side_effect=ValueError), self.assertLogs('blog.like_buffer'):
+            self.buffer.flush()
+            self.buffer.flush()
+        self.assertEqual({}, self.buffer.pending_for_user(self.user.pk))
+
+    def test_stop_drains_the_buffer(self):
+        """Likes still buffered are written when the buffer stops"""
+        self.buffer.add(self.user.pk, [self.post.pk], True)
+
+        self.buffer.stop()
+
+        self.assertEqual(1, Post.objects.get(pk=self.post.pk).like_count)
+
+
+# TransactionTestCase: the worker thread has its own connection and only sees committed rows
+@override_settings(LIKE_WRITE_BEHIND=True, LIKE_BUFFER_MAX_SIZE=2, LIKE_BUFFER_FLUSH_SECONDS=3600)
+class TestLikeBufferWorker(TransactionTestCase):
+    """The worker thread flushes the buffer when it is full"""
+
+    def test_worker_flushes_full_buffer(self):
+        buffer = like_buffer.get_buffer()
+        # Restarted by the next like with these settings
+        buffer.stop()
+        user = User.objects.create(username='liker')
+        posts = [Post.objects.create(user=user, title='Title {}'.format(i)) for i in range(2)]
+
+        buffer.add(user.pk, [posts[0].pk], True)
+        time.sleep(0.1)
+        self.assertEqual(0, Like.objects.count())
+
+        buffer.add(user.pk, [posts[1].pk], True)
+        # Poll the buffer, not the table: SQLite locks the shared in-memory test database while the worker writes
+        deadline = time.time() + 5
+        while buffer.pending_for_user(user.pk) and time.time() < deadline:
+            time.sleep(0.01)
+        buffer.stop()
+
+        self.assertEqual(2, Like.objects.count())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class TestPostIndexes(TestCase):
+    """Check with EXPLAIN that Post and Like queries use the indexes"""
+
+    def setUp(self):
+        self.user = User.objects.create()
+        self.post = Post.objects.create(user=self.user, title='Test title')
+
+    def explain(self, queryset):
+        """Return the SQLite query plan as one string"""
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def test_feed_page_uses_updated_at_id_index(self):
+        plan = self.explain(Post.objects.filter(updated_at__lte=self.post.updated_at)
+                            .filter(Q(updated_at__lt=self.post.updated_at) | Q(id__lt=self.post.id))
+                            .order_by('-updated_at', '-id')[:20])
+
+        self.assertIn('post_updated_at_id_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_user_posts_use_user_updated_at_index(self):
+        plan = self.explain(Post.objects.filter(user=self.user).order_by('-updated_at')[:20])
+
+        self.assertIn('post_user_updated_at_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_trending_uses_score_index(self):
+        plan = self.explain(Post.objects.filter(trending__isnull=False).order_by('-trending__score')[:20])
+
+        self.assertIn('blog_postscore_score', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_refresh_trending_reads_likes_from_index(self):
+        plan = self.explain(Like.objects.filter(created__gte=self.post.created_at, created__lte=self.post.created_at)
+                            .values_list('post_id', 'created'))
+
+        self.assertIn('COVERING INDEX like_created_post_idx', plan)
+
+    def test_like_lookup_uses_unique_user_post_index(self):
+        plan = self.explain(Like.objects.filter(user=self.user, post=self.post))
+
+        self.assertRegex(plan, r'SEARCH blog_like USING (COVERING )?INDEX \w+_uniq \(user_id=\? AND post_id=\?\)')
+
+    def test_duplicate_like_is_rejected(self):
+        Like.objects.create(user=self.user, post=self.post)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Like.objects.create(user=self.user, post=self.post)
@@ -0,0 +1,111 @@
+"""
+Cache of the recent Post ids of every author, for /users/{id}/posts/ and /posts/mine/.
+
+The entry of a user holds the (updated_at, id) of their POST_TIMELINE_SIZE
+newest Posts, newest first, and whether these are all of their Posts. Pages
+inside it cost one cache read and one `id__in` query. Pages after it are
+read from the (user, updated_at) index.
+
+PostAPIView keeps the entries up to date: a created or updated Post moves
+to the front, a destroyed one is removed. Changes are applied now and again
+after commit, as caching.invalidate() does, in case the entry was built
+from the database in between. Entries of
+authors of bulk imports are dropped and built again on the next read.
+Posts deleted some other way are skipped when the page is fetched, and
+every entry expires after the TIMEOUT of the 'posts' cache. Two
+concurrent writes by the same author can lose one update until then.
+"""
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+
+from blog import caching
+from blog.models import Post
+from test_task import replicas
+
+TIMELINE_KEY = 'posts:timeline:{}'
+
+
+def size():
+    return getattr(settings, 'POST_TIMELINE_SIZE', 100)
+
+
+def _key(user_id):
+    return TIMELINE_KEY.format(user_id)
+
+
+def get_entry(user_id):
+    """Return ([(updated_at, id)], complete) of the user, built from the database on a miss"""
+    entry = caching.get_cache().get(_key(user_id))
+    if entry is not None:
+        return entry
+
+    rows = list(Post.objects.filter(user_id=user_id).order_by('-updated_at', '-id')
+                .values_list('updated_at', 'id')[:size() + 1])
+    entry = (rows[:size()], len(rows) <= size())
+    # A replica may miss the latest Posts, see caching.cached_response
+    timeout = replicas.pin_seconds() if replicas.reading_from_replicas() else DEFAULT_TIMEOUT
+    caching.get_cache().set(_key(user_id), entry, timeout=timeout)
+    return entry
+
+
+def page(user_id, position, reverse, limit):
+    """
+    Ids of up to `limit` Posts of the user after the cursor position (updated_at, id),
+    in the order PostCursorPagination reads them. None if the page is not all in the cache
+    """
+    entries, complete = get_entry(user_id)
+
+    # entries[:start] are newer than the position
+    start = 0
+    if position is not None:
+        start = next((i for i, entry in enumerate(entries) if entry <= position), len(entries))
+        if start == len(entries) and not complete:
+            # The position is older than the cached Posts
+            return None
+
+    if reverse:
+        # The nearest newer Posts first
+        return [pk for _, pk in reversed(entries[max(start - limit, 0):start])]
+
+    if start < len(entries) and entries[start] == position:
+        start += 1
+    ids = [pk for _, pk in entries[start:start + limit]]
+    if len(ids) < limit and not complete:
+        return None
+    return ids
+
+
+def _update(user_id, change):
+    def apply():
+        cache = caching.get_cache()
+        entry = cache.get(_key(user_id))
+        if entry is not None:
+            cache.set(_key(user_id), change(*entry))
+    apply()
+    transaction.on_commit(apply)
+
+
+def add(post):
+    """Put the created or updated Post in the timeline of its author"""
+    new = (post.updated_at, post.pk)
+
+    def change(entries, complete):
+        entries = sorted([entry for entry in entries if entry[1] != post.pk] + [new], reverse=True)
+        if len(entries) > size():
+            return entries[:size()], False
+        return entries, complete
+    _update(post.user_id, change)
+
+
+def remove(post):
+    """Take the destroyed Post out of the timeline of its author"""
+    def change(entries, complete):
+        return [entry for entry in entries if entry[1] != post.pk], complete
+    _update(post.user_id, change)
+
+
+def drop(user_id):
+    """Forget the timeline of the user, when Posts were created without their ids"""
+    caching.get_cache().delete(_key(user_id))
+    transaction.on_commit(lambda: caching.get_cache().delete(_key(user_id)))
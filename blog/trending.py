@@ -0,0 +1,56 @@
+"""
+Trending Posts: Posts ranked by time-decayed likes.
+
+A like made at time t is worth exp(-rate * (now - t)) now, with
+rate = ln 2 / TRENDING_HALF_LIFE_HOURS, and the trend of a Post is the sum
+over its likes. `now` is the same for every Post, so the ranking is the
+ranking of log(sum of exp(rate * t)), which is what PostScore.score keeps.
+It never decays: a new like is added to it with logaddexp, an unliked one
+taken out with logsubexp, and ordering by the score column needs no
+computation per request.
+
+Likes are added as they are made and taken out when they are unliked, with
+the time they were made (PostScoreQuerySet.record_likes and remove_likes).
+Likes older than TRENDING_WINDOW_HALF_LIVES half-lives are dropped by
+`manage.py refresh_trending`, which recomputes every score.
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import FloatField, Func
+
+
+class Epoch(Func):
+    """Seconds since 1970 of a datetime expression, as a float"""
+    template = 'EXTRACT(EPOCH FROM %(expressions)s)'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection):
+        return self.as_sql(compiler, connection, template='((julianday(%(expressions)s) - 2440587.5) * 86400.0)')
+
+    def as_mysql(self, compiler, connection):
+        return self.as_sql(compiler, connection, template='UNIX_TIMESTAMP(%(expressions)s)')
+
+
+def rate():
+    """Decay rate per second"""
+    return math.log(2) / (getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24) * 3600)
+
+
+def window_start(now):
+    """Likes made before this are worth less than 2 ** -TRENDING_WINDOW_HALF_LIVES of a new one"""
+    half_lives = getattr(settings, 'TRENDING_WINDOW_HALF_LIVES', 10)
+    return now - timedelta(hours=getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24) * half_lives)
+
+
+def logaddexp(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def logsubexp(a, b):
+    """log(exp(a) - exp(b)), None if less than a millionth of exp(a) is left: rounding errors of the likes taken out"""
+    if b - a > -1e-6:
+        return None
+    return a + math.log1p(-math.exp(b - a))
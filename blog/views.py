@@ -1,17 +1,34 @@
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework import status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
+from blog import caching, export, like_buffer, search, timeline
+from blog.bulk import import_posts
 from blog.models import Post
+from blog.pagination import PostCursorPagination, SearchPagination, TimelinePagination
 from blog.permissions import IsPostOwner
-from .serializers import PostSerializer
+from test_task.conditional import conditional_response, make_etag
+from test_task.replicas import ReplicaReadsMixin
+from test_task.serialization import FAST_RENDERER_CLASSES
+from .serializers import (MAX_BULK_POSTS, ExportSerializer, PostIdsSerializer, PostLikesSerializer, PostSerializer,
+                          SearchSerializer, TrendingSerializer)
 
 
-class PostAPIView(ModelViewSet):
+class PostAPIView(ReplicaReadsMixin, ModelViewSet):
     """
     list:
-    Return a list of all posts
+    Return a page of posts, newest first. Follow the `next` link for the next page.
+    `body` is left out unless it is asked for with `?fields=`
+
+    Both list and retrieve accept `?fields=id,title,...` to return only these fields
 
     create:
     Create a new post. Instanse - user
@@ -28,26 +45,293 @@ class PostAPIView(ModelViewSet):
     permission_classes = (permissions.IsAuthenticated, IsPostOwner,)
     serializer_class = PostSerializer
     queryset = Post.objects.all()
+    pagination_class = PostCursorPagination
+    renderer_classes = FAST_RENDERER_CLASSES
+
+    # Always selected: the cursor and the validators need them
+    required_columns = ('id', 'updated_at')
+
+    # Actions returning lists of Posts. They accept ?fields= as retrieve does and leave out body by default.
+    # get_queryset() returns rows of PostSerializer.values_queryset() for them, see serialize_list()
+    list_actions = ('list', 'trending', 'search', 'mine', 'user_posts')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('like', 'unlike'):
+            # Answering with the new like state needs only the counter, not the body
+            queryset = queryset.only('id', 'like_count')
+            if like_buffer.enabled():
+                # The buffer compares the new state with the stored one
+                queryset = queryset.with_liked_by(self.request.user)
+            return queryset
+
+        if self.request.user.is_authenticated:
+            # liked_by_me for every Post comes from a subquery of the main query
+            queryset = queryset.with_liked_by(self.request.user)
+        if self.action in self.list_actions:
+            serializer = PostSerializer(fields=self.get_requested_fields())
+            return serializer.values_queryset(queryset, *self.required_columns)
+        fields = self.get_requested_fields()
+        if fields is not None:
+            queryset = queryset.only(*self.get_columns(fields))
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.list_actions + ('retrieve',):
+            kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['pending_likes'] = self.get_pending_likes()
+        return context
+
+    def get_pending_likes(self):
+        """{post_id: liked} of the auth user still in the like buffer"""
+        if like_buffer.enabled() and self.request.user.is_authenticated:
+            return like_buffer.get_buffer().pending_for_user(self.request.user.pk)
+        return {}
+
+    def get_requested_fields(self):
+        """
+        Names of the serializer fields to return for retrieve and list_actions:
+        the ones in ?fields=, or all except body for lists. None means all
+        """
+        if self.action not in self.list_actions + ('retrieve',):
+            return None
+
+        all_fields = PostSerializer().get_values_plan().field_names
+        requested = self.request.query_params.get('fields')
+        if requested:
+            fields = [name for name in requested.split(',') if name]
+            unknown = set(fields) - set(all_fields)
+            if unknown:
+                raise ValidationError({'fields': 'Unknown fields: {}'.format(', '.join(sorted(unknown)))})
+            return fields
+        if self.action in self.list_actions:
+            return [name for name in all_fields if name != 'body']
+        return None
+
+    def get_columns(self, fields):
+        """Model columns to SELECT for the serializer fields"""
+        columns = list(self.required_columns)
+        for name in fields:
+            try:
+                Post._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if name not in columns:
+                columns.append(name)
+        return columns
+
+    def serialize_list(self, rows):
+        """Data of a list action from rows of get_queryset(), without building Post instances"""
+        return self.get_serializer().to_representation_values(rows)
+
+    def list(self, request, *args, **kwargs):
+        key = caching.list_key(request)
+        return caching.cached_response(key, self.list_page, request, *args, **kwargs)
+
+    def list_page(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        return self.get_paginated_response(self.serialize_list(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs[self.lookup_field])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+
+        # Validators for If-None-Match, without loading the Post. No Last-Modified:
+        # likes change like_count and liked but not updated_at, the ETag covers them
+        state = Post.objects.filter(pk=pk).with_liked_by(request.user) \
+            .values_list('updated_at', 'like_count', 'liked').first()
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+        updated_at, like_count, liked = state
+
+        key = caching.post_key(request, pk)
+        get_response = partial(caching.cached_response, key, super().retrieve, request, *args, **kwargs)
+        liked, like_count = like_buffer.overlay(liked, like_count, self.get_pending_likes().get(pk))
+        return conditional_response(request, get_response,
+                                    etag=make_etag(request, pk, updated_at.isoformat(), like_count, liked))
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+        caching.invalidate()
+        timeline.add(serializer.instance)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        caching.invalidate(serializer.instance.pk)
+        # updated_at changed, the Post is the newest of its author
+        timeline.add(serializer.instance)
+
+    def perform_destroy(self, instance):
+        pk = instance.pk
+        timeline.remove(instance)
+        instance.delete()
+        caching.invalidate(pk)
 
     @action(detail=True, methods=['POST'], permission_classes=[permissions.IsAuthenticated])
     def like(self, request, *args, **kwargs):
         """
         post:
-        Set like to Post from auth user
+        Set like to Post from auth user. Return the like state and like_count.
+        201 if the like is new, 200 if the Post was already liked
         """
-        obj = self.get_object()
-        obj.add_like(request.user)
-        return Response(status=status.HTTP_201_CREATED)
+        created, like_count = self.set_like(True)
+        return Response({'liked': True, 'like_count': like_count},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
     @action(detail=True, methods=['DELETE'], permission_classes=[permissions.IsAuthenticated])
     def unlike(self, request, *args, **kwargs):
         """
         delete:
-        Delete like to Post from auth user
+        Delete like to Post from auth user. Return the like state and like_count
         """
+        deleted, like_count = self.set_like(False)
+        return Response({'liked': False, 'like_count': like_count}, status=status.HTTP_200_OK)
+
+    def set_like(self, liked):
+        """Like or unlike the Post by auth user. Return whether it changed and the new like_count"""
         obj = self.get_object()
-        obj.unlike(request.user)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        if like_buffer.enabled():
+            return like_buffer.get_buffer().set_like(self.request.user, obj, liked)
+        changed = obj.add_like(self.request.user) if liked else obj.unlike(self.request.user)
+        return changed, obj.like_count
+
+    @action(detail=False, methods=['GET', 'POST'], permission_classes=[permissions.IsAuthenticated])
+    def likes(self, request, *args, **kwargs):
+        """
+        get:
+        Return {post_id: {liked, like_count}} for auth user.
+        Post ids are given as ?ids=1,2,3
+
+        post:
+        Like and unlike Posts from auth user in one transaction.
+        Body: {"like": [ids], "unlike": [ids]}. Return the new state of these Posts
+        """
+        if request.method == 'GET':
+            ids = [i for i in request.query_params.get('ids', '').split(',') if i]
+            serializer = PostIdsSerializer(data={'ids': ids})
+            serializer.is_valid(raise_exception=True)
+            ids = serializer.validated_data['ids']
+        else:
+            serializer = PostLikesSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            like = serializer.validated_data.get('like', [])
+            unlike = serializer.validated_data.get('unlike', [])
+            if like_buffer.enabled():
+                buffer = like_buffer.get_buffer()
+                buffer.add(request.user.pk, like, True)
+                buffer.add(request.user.pk, unlike, False)
+                caching.invalidate(*(like + unlike))
+            else:
+                with transaction.atomic():
+                    if like:
+                        Post.objects.filter(pk__in=like).add_likes(request.user)
+                    if unlike:
+                        Post.objects.filter(pk__in=unlike).remove_likes(request.user)
+            ids = like + unlike
+
+        states = Post.objects.filter(pk__in=ids).like_states(request.user)
+        pending = self.get_pending_likes()
+        for pk, state in states.items():
+            state['liked'], state['like_count'] = like_buffer.overlay(state['liked'], state['like_count'],
+                                                                      pending.get(pk))
+        return Response(states)
+
+    @action(detail=False, methods=['GET'])
+    def trending(self, request, *args, **kwargs):
+        """
+        get:
+        Return the Posts with the most recent likes, most trending first.
+        A like counts half as much every TRENDING_HALF_LIFE_HOURS.
+        `?limit=` sets the number of Posts, 20 by default. Accepts `?fields=` as list does
+        """
+        serializer = TrendingSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        queryset = self.get_queryset().filter(trending__isnull=False).order_by('-trending__score')
+        posts = list(queryset[:serializer.validated_data['limit']])
+        return Response(self.serialize_list(posts))
+
+    @action(detail=False, methods=['GET'])
+    def mine(self, request, *args, **kwargs):
+        """
+        get:
+        Return a page of the Posts of auth user, newest first, as list does
+        """
+        return self.timeline(request.user.pk)
+
+    def user_posts(self, request, user_pk, *args, **kwargs):
+        """
+        get:
+        Return a page of the Posts of the given user, newest first, as list does
+        """
+        return self.timeline(user_pk)
+
+    def timeline(self, user_id):
+        """A page of the Posts of the user, the recent ones fetched by the ids cached in blog.timeline"""
+        paginator = TimelinePagination()
+        page = paginator.paginate_timeline(self.get_queryset(), user_id, self.request)
+        # Only an empty timeline needs to tell a user without Posts from a missing one
+        if not page and paginator.cursor.position is None and not User.objects.filter(pk=user_id).exists():
+            raise NotFound()
+        return paginator.get_paginated_response(self.serialize_list(page))
+
+    @action(detail=False, methods=['GET'])
+    def search(self, request, *args, **kwargs):
+        """
+        get:
+        Return the Posts with every word of `?q=` in their title or body, best match first.
+        Paginated with `?page=` and `?page_size=`. Accepts `?fields=` as list does
+        """
+        serializer = SearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        paginator = SearchPagination()
+        ids = paginator.paginate_search(partial(search.get_backend().search, serializer.validated_data['q']),
+                                        request)
+        # Posts deleted since they were indexed are left out
+        posts = self.get_queryset().in_bulk(ids, field_name='id')
+        page = [posts[pk] for pk in ids if pk in posts]
+        return paginator.get_paginated_response(self.serialize_list(page))
+
+    @action(detail=False, methods=['POST'], permission_classes=[permissions.IsAuthenticated])
+    def bulk(self, request, *args, **kwargs):
+        """
+        post:
+        Create Posts of auth user from a JSON array of posts.
+        Invalid rows are skipped and returned in `errors` with their index.
+        201 if Posts were created, 200 otherwise, 400 if the body is not a list
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of posts.']})
+        if len(request.data) > MAX_BULK_POSTS:
+            raise ValidationError({'non_field_errors': [
+                'Ensure there are no more than {} posts.'.format(MAX_BULK_POSTS)]})
+
+        created, errors = import_posts(request.data, request.user)
+
+        data = {
+            'created': created,
+            'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+        }
+        return Response(data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['GET'], permission_classes=[permissions.IsAdminUser])
+    def export(self, request, *args, **kwargs):
+        """
+        get:
+        Stream every row of a table. Admin only.
+        ?table=posts|likes (default posts), ?fmt=ndjson|csv (default ndjson)
+        """
+        serializer = ExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        table, fmt = serializer.validated_data['table'], serializer.validated_data['fmt']
+
+        response = StreamingHttpResponse(export.export(table, fmt), content_type=export.FORMATS[fmt])
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(table, fmt)
+        return response
@@ -0,0 +1,45 @@
+"""Helpers for the bulk imports of the apps"""
+import json
+from itertools import islice
+
+
+def batches(iterable, size):
+    """Lists of up to `size` items of the iterable, read one batch at a time"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class NDJSONRows:
+    """
+    Rows of an NDJSON file for the import commands, read as they are iterated.
+    Blank lines are skipped. Lines that are not JSON are left out and kept in
+    `errors` by line number, so one bad line does not stop the import
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.errors = {}
+        # Line number of each row handed out, by row index
+        self.line_numbers = []
+
+    def __iter__(self):
+        for number, line in enumerate(self.lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                self.errors[number] = {'non_field_errors': ['Invalid JSON: {}'.format(exc)]}
+                continue
+            self.line_numbers.append(number)
+            yield row
+
+    def line_errors(self, row_errors):
+        """{line number: errors} of the lines that are not JSON and of the {row index: errors} of the import"""
+        errors = dict(self.errors)
+        errors.update((self.line_numbers[index], row_errors[index]) for index in row_errors)
+        return errors
@@ -0,0 +1,37 @@
+"""
+Conditional GET for API views.
+
+The view reads the validators of the requested object with a cheap
+values() query and passes them here. If the client already has that
+version, it gets an empty 304 and the object is never loaded or serialized.
+"""
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(request, *values):
+    """Strong ETag of a representation: the validator values and the requested URL"""
+    state = '|'.join(str(value) for value in (request.get_full_path(),) + values)
+    return '"{}"'.format(hashlib.md5(state.encode('utf-8')).hexdigest())
+
+
+def conditional_response(request, get_response, etag=None, last_modified=None):
+    """
+    Return 304 if If-None-Match / If-Modified-Since match the given validators,
+    otherwise the response of get_response() with ETag and Last-Modified headers
+    """
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        return response
+
+    response = get_response()
+    if response.status_code == 200:
+        if etag:
+            response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    return response
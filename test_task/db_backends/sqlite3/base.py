@@ -0,0 +1,39 @@
+"""
+SQLite backend with per-connection tuning, configured in DATABASES OPTIONS:
+
+    'pragmas': {'journal_mode': 'WAL', ...}
+        run as PRAGMA statements on every new connection
+    'transaction_mode': 'IMMEDIATE'
+        BEGIN mode of atomic blocks. IMMEDIATE takes the write lock at the
+        start, so a transaction that reads and then writes waits for the
+        busy timeout instead of failing when another one wrote meanwhile
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute('PRAGMA {} = {}'.format(name, value))
+        return conn
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'DEFERRED').upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured('transaction_mode must be one of {}'.format(', '.join(TRANSACTION_MODES)))
+        return mode
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN {}'.format(self.transaction_mode))
@@ -0,0 +1,176 @@
+"""
+Per-request SQL and timing metrics, recorded by QueryMetricsMiddleware.
+
+For every request the middleware counts the queries of all databases and
+their time with connection.execute_wrapper(), times Response.render() of
+DRF responses and measures the body. The renderer phase is the renderer
+with the serializer work it runs itself, the forms of the browsable API for
+example. The serialization phase is the time spent in .data and
+to_representation_values() of the serializers with TimedSerializerMixin or
+ValuesSerializerMixin, see timed_serialization(); it is also part of the
+renderer phase when the renderer runs them.
+The values are sent back in a Server-Timing header and added to totals per
+view, named like 'PostAPIView.list' or 'UserDetailAPIView.retrieve'.
+snapshot() returns the totals of this process.
+
+Queries of a StreamingHttpResponse run after the middleware returned and
+are not counted.
+"""
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.dispatch import Signal
+from rest_framework import mixins
+
+# Sent for every request with view (the name) and metrics (a RequestMetrics)
+request_measured = Signal(providing_args=['view', 'metrics'])
+
+# Action of generic views by HTTP method, as viewsets name them
+GENERIC_ACTIONS = [
+    ('get', mixins.ListModelMixin, 'list'),
+    ('get', mixins.RetrieveModelMixin, 'retrieve'),
+    ('post', mixins.CreateModelMixin, 'create'),
+    ('put', mixins.UpdateModelMixin, 'update'),
+    ('patch', mixins.UpdateModelMixin, 'partial_update'),
+    ('delete', mixins.DestroyModelMixin, 'destroy'),
+]
+
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def server_timing_enabled():
+    return getattr(settings, 'QUERY_METRICS_SERVER_TIMING', True)
+
+
+class RequestMetrics:
+    """Queries, SQL time, serialization time, renderer time and response size of one request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.renderer_time = 0.0
+        self.total_time = 0.0
+        self.response_size = None
+        self._start = time.perf_counter()
+        self._renderer_start = None
+        self._serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """Execute wrapper of the connections"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def record_queries(self):
+        """Context manager that wraps the queries of every database of this thread"""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    @contextmanager
+    def serializing(self):
+        """Context manager adding its time to serialization_time. Nested blocks are counted once"""
+        if self._serializing:
+            yield
+            return
+        self._serializing = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.serialization_time += time.perf_counter() - start
+            self._serializing = False
+
+    def renderer_started(self):
+        self._renderer_start = time.perf_counter()
+
+    def renderer_finished(self, response):
+        self.renderer_time += time.perf_counter() - self._renderer_start
+
+    def finish(self, response):
+        self.total_time = time.perf_counter() - self._start
+        if not response.streaming:
+            self.response_size = len(response.content)
+
+    def server_timing(self):
+        """Value of the Server-Timing header, durations in milliseconds"""
+        return ', '.join([
+            'db;dur={:.3f};desc="{} queries"'.format(self.db_time * 1000, self.queries),
+            'serialization;dur={:.3f}'.format(self.serialization_time * 1000),
+            'renderer;dur={:.3f};desc="Response.render()"'.format(self.renderer_time * 1000),
+            'total;dur={:.3f}'.format(self.total_time * 1000),
+        ])
+
+
+def timed_serialization(request):
+    """Context manager timing serialization for the request, if QueryMetricsMiddleware measures it"""
+    request_metrics = getattr(request, 'metrics', None)
+    if request_metrics is None:
+        return ExitStack()
+    return request_metrics.serializing()
+
+
+def view_name(request):
+    """'ViewClass.action' of the view that answered, the URL name for other views, or None"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    cls = getattr(match.func, 'cls', None)
+    if cls is None:
+        return match.view_name
+    method = request.method.lower()
+    action = (getattr(match.func, 'actions', None) or {}).get(method)
+    if action is None:
+        action = next((name for generic_method, mixin, name in GENERIC_ACTIONS
+                       if generic_method == method and issubclass(cls, mixin)), method)
+    return '{}.{}'.format(cls.__name__, action)
+
+
+def record(view, metrics):
+    """Add the metrics of one request to the totals of its view"""
+    with _totals_lock:
+        totals = _totals.setdefault(view, {
+            'requests': 0, 'queries': 0, 'max_queries': 0,
+            'db_ms': 0.0, 'serialization_ms': 0.0, 'renderer_ms': 0.0, 'total_ms': 0.0, 'response_bytes': 0,
+        })
+        totals['requests'] += 1
+        totals['queries'] += metrics.queries
+        totals['max_queries'] = max(totals['max_queries'], metrics.queries)
+        totals['db_ms'] += metrics.db_time * 1000
+        totals['serialization_ms'] += metrics.serialization_time * 1000
+        totals['renderer_ms'] += metrics.renderer_time * 1000
+        totals['total_ms'] += metrics.total_time * 1000
+        totals['response_bytes'] += metrics.response_size or 0
+    request_measured.send(sender=RequestMetrics, view=view, metrics=metrics)
+
+
+def snapshot():
+    """{view: totals and means per request} of the requests answered by this process"""
+    with _totals_lock:
+        result = {}
+        for view, totals in _totals.items():
+            requests = totals['requests']
+            result[view] = dict(
+                totals,
+                mean_queries=totals['queries'] / requests,
+                mean_db_ms=totals['db_ms'] / requests,
+                mean_serialization_ms=totals['serialization_ms'] / requests,
+                mean_renderer_ms=totals['renderer_ms'] / requests,
+                mean_total_ms=totals['total_ms'] / requests,
+                mean_response_bytes=totals['response_bytes'] / requests,
+            )
+        return result
+
+
+def reset():
+    with _totals_lock:
+        _totals.clear()
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+
+from test_task import metrics
+
+
+class AdminOnlyMiddleware:
+    """
+    Run settings.ADMIN_ONLY_MIDDLEWARE only for requests under the admin.
+
+    The API authenticates with JWT and does not need sessions, CSRF, messages
+    or frame options, so its requests skip that part of the stack. Admin
+    requests go through it as if it was listed in MIDDLEWARE at this place,
+    including the process_view, process_exception and
+    process_template_response hooks.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefixes = tuple(getattr(settings, 'ADMIN_ONLY_MIDDLEWARE_PATHS', ('/admin/',)))
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+
+        handler = convert_exception_to_response(get_response)
+        for middleware_path in reversed(settings.ADMIN_ONLY_MIDDLEWARE):
+            try:
+                instance = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(instance, 'process_view'):
+                self.view_middleware.insert(0, instance.process_view)
+            if hasattr(instance, 'process_template_response'):
+                self.template_response_middleware.append(instance.process_template_response)
+            if hasattr(instance, 'process_exception'):
+                self.exception_middleware.append(instance.process_exception)
+            handler = convert_exception_to_response(instance)
+        self.admin_handler = handler
+
+    def is_admin(self, request):
+        return request.path_info.startswith(self.prefixes)
+
+    def __call__(self, request):
+        if self.is_admin(request):
+            return self.admin_handler(request)
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_admin(request):
+            for process_view in self.view_middleware:
+                response = process_view(request, view_func, view_args, view_kwargs)
+                if response:
+                    return response
+        return None
+
+    def process_template_response(self, request, response):
+        if self.is_admin(request):
+            for process_template_response in self.template_response_middleware:
+                response = process_template_response(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_admin(request):
+            for process_exception in self.exception_middleware:
+                response = process_exception(request, exception)
+                if response:
+                    return response
+        return None
+
+
+class QueryMetricsMiddleware:
+    """
+    Record queries, SQL time, renderer time and response size of every request,
+    see test_task/metrics.py. First in MIDDLEWARE, so the total covers the others
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics = metrics.RequestMetrics()
+        with request.metrics.record_queries():
+            response = self.get_response(request)
+        request.metrics.finish(response)
+
+        if metrics.server_timing_enabled():
+            response['Server-Timing'] = request.metrics.server_timing()
+        view = metrics.view_name(request)
+        if view is not None:
+            metrics.record(view, request.metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF renders the Response
+        request.metrics.renderer_started()
+        response.add_post_render_callback(request.metrics.renderer_finished)
+        return response
@@ -0,0 +1,140 @@
+"""
+Read replicas for the API views.
+
+Views with ReplicaReadsMixin read from one of settings.DATABASE_REPLICAS
+during GET, HEAD and OPTIONS requests. Writes always go to 'default'.
+
+A client that writes is pinned to 'default' for REPLICA_PIN_SECONDS, so
+it reads its own writes while the replicas catch up. The client is told
+apart by its Authorization header, its session cookie or its address.
+"""
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# One entry per client that wrote in the last REPLICA_PIN_SECONDS
+CACHE_ALIAS = 'replicas'
+PIN_KEY = 'replicas:pin:{}'
+
+# Sessions are read right after login, from a client that is not pinned.
+# Database caches (app label 'django_cache') are read by every request
+PRIMARY_ONLY_APPS = ('sessions', 'django_cache')
+
+_state = threading.local()
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def reading_from_replicas():
+    """True while the current thread sends reads to the replicas"""
+    return getattr(_state, 'enabled', False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    previous = reading_from_replicas()
+    _state.enabled = enabled
+    try:
+        yield
+    finally:
+        _state.enabled = previous
+
+
+def client_key(request):
+    client = (request.META.get('HTTP_AUTHORIZATION')
+              or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+              or request.META.get('REMOTE_ADDR', ''))
+    return PIN_KEY.format(hashlib.md5(client.encode('utf-8')).hexdigest())
+
+
+def pin(request):
+    """Send the reads of this client to 'default' for the next REPLICA_PIN_SECONDS"""
+    caches[CACHE_ALIAS].set(client_key(request), True, timeout=pin_seconds())
+
+
+def is_pinned(request):
+    return caches[CACHE_ALIAS].get(client_key(request), False)
+
+
+def copy_sqlite_database(connection, path):
+    """
+    Replace the SQLite file at path with a consistent copy of the database of the
+    connection. The copy uses a rollback journal: nothing writes to a replica
+    """
+    temporary = path + '.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM INTO %s', [temporary])
+    copy = sqlite3.connect(temporary)
+    try:
+        copy.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        copy.close()
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.replace(temporary, path)
+
+
+class ReplicaRouter:
+    """Reads go to a random replica while replica_reads() is on, everything else to 'default'"""
+
+    def db_for_read(self, model, **hints):
+        aliases = replica_aliases()
+        if aliases and reading_from_replicas() and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            return random.choice(aliases)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as 'default'
+        databases = {DEFAULT_DB_ALIAS} | set(replica_aliases())
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas are copies of 'default', see the sync_replicas command
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaReadsMixin:
+    """
+    For DRF views: safe requests read from the replicas unless the client is
+    pinned. Other requests pin the client before and after they run
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if not replica_aliases():
+            return super().dispatch(request, *args, **kwargs)
+
+        if request.method in SAFE_METHODS:
+            with replica_reads(not is_pinned(request)):
+                return super().dispatch(request, *args, **kwargs)
+
+        pin(request)
+        try:
+            with replica_reads(False):
+                return super().dispatch(request, *args, **kwargs)
+        finally:
+            # The window starts again when the write is committed
+            pin(request)
@@ -0,0 +1,204 @@
+"""
+Read-only fast path of ModelSerializers for list responses.
+
+ValuesSerializerMixin serializes the rows of values_list() instead of model
+instances. The plan of a serializer, which column holds which field and how
+it is converted, is computed once per class and set of fields. Serializing
+a row then skips get_attribute() and to_representation() of every field,
+and the model instance is never built. The output is the same as .data of
+the serializer with many=True, with plain dicts instead of OrderedDicts.
+
+TimedSerializerMixin and to_representation_values() count their work as the
+serialization time of the request in their context, see test_task/metrics.py.
+
+FastJSONRenderer renders with orjson when it is installed, and with the
+JSONRenderer of DRF otherwise. Both give the same bytes for the data of
+these views, see FastJSONRenderer.
+"""
+import copy
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db import models
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+from test_task import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Model fields whose values are already the representation of these serializer fields
+NATIVE_REPRESENTATIONS = [
+    (serializers.CharField.to_representation, (models.CharField, models.TextField)),
+    (serializers.IntegerField.to_representation, (models.AutoField, models.IntegerField)),
+]
+
+_plans = {}
+
+
+def datetime_formatter(field):
+    """
+    DateTimeField.to_representation with the settings and the time zone looked
+    up once, for the datetimes of a page. The field itself for other formats
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = getattr(field, 'timezone', field.default_timezone())
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def format_datetime(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            return value[:-6] + 'Z'
+        return value
+    return format_datetime
+
+
+class ValuesPlan:
+    """Columns to select for the fields of a serializer, and how to turn them into the representation"""
+
+    def __init__(self, serializer):
+        model = serializer.Meta.model
+        self.columns = []
+        self.fields = []
+        self.datetime_fields = {}
+
+        for field in serializer._readable_fields:
+            column, representation = self.get_column(serializer, model, field)
+            if column not in self.columns:
+                self.columns.append(column)
+            convert = None
+            if representation is not None:
+                # An unbound copy: the field holds the serializer, and its context the request
+                representation = copy.deepcopy(representation)
+                convert = representation.to_representation
+            if isinstance(representation, serializers.DateTimeField):
+                self.datetime_fields[len(self.fields)] = representation
+            self.fields.append((field.field_name, self.columns.index(column), convert))
+        self.field_names = [name for name, _, _ in self.fields]
+
+    def get_column(self, serializer, model, field):
+        """
+        (column, field) of a serializer field: the field whose to_representation()
+        converts the values of the column, None if they are the representation
+        """
+        if field.field_name in serializer.values_columns:
+            return serializer.values_columns[field.field_name], None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            model_field = None
+        if model_field is None or not model_field.concrete or model_field.many_to_many:
+            raise ImproperlyConfigured(
+                '{}.{} is not a column of {}, add it to values_columns'.format(
+                    type(serializer).__name__, field.field_name, model.__name__))
+
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            # The column holds the primary key that the field returns
+            return model_field.attname, field.pk_field
+        for representation, model_fields in NATIVE_REPRESENTATIONS:
+            if type(field).to_representation is representation and isinstance(model_field, model_fields):
+                return model_field.attname, None
+        return model_field.attname, field
+
+    def converters(self):
+        """[(field name, index in the row, convert)], with the datetimes in the current time zone"""
+        converters = list(self.fields)
+        for position, field in self.datetime_fields.items():
+            name, index, _ = converters[position]
+            converters[position] = (name, index, datetime_formatter(field))
+        return converters
+
+
+class TimedSerializerMixin:
+    """Serializer whose .data is timed as serialization of the request in its context"""
+
+    @property
+    def data(self):
+        with metrics.timed_serialization(self.context.get('request')):
+            return super().data
+
+
+class ValuesSerializerMixin:
+    """
+    Read-only fast path of a ModelSerializer for lists.
+
+    values_queryset() selects the columns of the fields as named rows, and
+    to_representation_values() turns a list of these rows into the same data
+    as .data of the serializer with many=True.
+
+    Fields can be model columns or forward relations returned as primary keys.
+    Other fields, SerializerMethodFields for example, are read as they are
+    from the columns or annotations given in values_columns.
+    """
+    # {field name: column or annotation} for the fields that are not model columns
+    values_columns = {}
+
+    def get_values_plan_key(self):
+        """Serializers of the same class with the same key have the same fields and share a plan"""
+        return None
+
+    def get_values_plan(self):
+        key = (type(self), self.get_values_plan_key())
+        plan = _plans.get(key)
+        if plan is None:
+            plan = _plans[key] = ValuesPlan(self)
+        return plan
+
+    def values_queryset(self, queryset, *columns):
+        """The queryset as rows with the columns of the fields and the extra columns, as namedtuples"""
+        selected = list(self.get_values_plan().columns)
+        for column in columns:
+            if column not in selected:
+                selected.append(column)
+        return queryset.values_list(*selected, named=True)
+
+    def to_representation_values(self, rows):
+        """List of rows of values_queryset() to the list of their representations"""
+        with metrics.timed_serialization(self.context.get('request')):
+            return self._representation_values(rows)
+
+    def _representation_values(self, rows):
+        converters = self.get_values_plan().converters()
+        data = []
+        for row in rows:
+            item = {}
+            for name, index, convert in converters:
+                value = row[index]
+                item[name] = value if convert is None or value is None else convert(value)
+            data.append(item)
+        return data
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed.
+
+    The output has the same bytes as JSONRenderer for compact UTF-8 JSON:
+    U+2028 and U+2029 are escaped, and other types go through the encoder of
+    DRF, datetimes included. orjson writes floats in its own way, so views
+    using this renderer must not return floats. Data orjson cannot encode
+    and indented output are rendered by JSONRenderer
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=encoders.JSONEncoder().default, option=self.options)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode('utf-8'), b'\\u2028').replace('\u2029'.encode('utf-8'), b'\\u2029')
+
+
+# DEFAULT_RENDERER_CLASSES with FastJSONRenderer in place of JSONRenderer
+FAST_RENDERER_CLASSES = tuple(FastJSONRenderer if renderer is JSONRenderer else renderer
+                              for renderer in api_settings.DEFAULT_RENDERER_CLASSES)
@@ -38,11 +38,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'blog',
+    'user_profile',
 
     'rest_framework',
 ]
 
 MIDDLEWARE = [
+    'test_task.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,13 +79,133 @@ WSGI_APPLICATION = 'test_task.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
 
+# test_task.db_backends.sqlite3 runs the pragmas on every new connection.
+# WAL lets readers go on while a like is written, and connections are kept
+# between requests so the pragmas run once per connection, not per request
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'test_task.db_backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'test.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': 5000,
+                'mmap_size': 256 * 1024 * 1024,
+                'cache_size': -64 * 1024,
+                'temp_store': 'MEMORY',
+            },
+        },
     }
 }
 
+# Read-only copy of 'default' for GET requests, see test_task/replicas.py.
+# Locally it is an SQLite file refreshed with `manage.py sync_replicas`.
+# Replicas are used only when listed in DJANGO_DATABASE_REPLICAS
+
+DATABASES['replica'] = {
+    'ENGINE': 'test_task.db_backends.sqlite3',
+    'NAME': os.path.join(BASE_DIR, 'test-replica.sqlite3'),
+    'CONN_MAX_AGE': 600,
+    'OPTIONS': {
+        'pragmas': {
+            'query_only': 'ON',
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+        },
+    },
+    'TEST': {
+        'MIRROR': 'default',
+    },
+}
+
+DATABASE_REPLICAS = [alias for alias in os.environ.get('DJANGO_DATABASE_REPLICAS', '').split(',') if alias]
+
+DATABASE_ROUTERS = ['test_task.replicas.ReplicaRouter']
+
+# Reads of a client go to 'default' for this long after it writes
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+# 'posts' keeps PostAPIView responses and timelines, see blog/caching.py.
+# 'tokens' keeps the JWT deny-list, see user_profile/authentication.py. It must
+# never cull: a culled entry is a revoked token that is accepted again.
+# 'replicas' keeps the clients pinned to the primary, see test_task/replicas.py
+# LocMemCache is per process, so these are only valid with a single process
+# (runserver, the tests): every process has to see the writes of the others.
+# settings_production keeps them in the database
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tokens',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10 ** 9,
+        },
+    },
+    'replicas': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'replicas',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    'posts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'posts',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
+# Like and unlike requests are buffered and written by a background thread,
+# see blog/like_buffer.py. The buffer is flushed when it has
+# LIKE_BUFFER_MAX_SIZE states or every LIKE_BUFFER_FLUSH_SECONDS.
+# A batch failing with an error other than a locked database is retried
+# LIKE_BUFFER_MAX_RETRIES times before it is dropped
+
+LIKE_WRITE_BEHIND = os.environ.get('DJANGO_LIKE_WRITE_BEHIND') == '1'
+LIKE_BUFFER_MAX_SIZE = 500
+LIKE_BUFFER_FLUSH_SECONDS = 1.0
+LIKE_BUFFER_MAX_RETRIES = 3
+
+
+# Trending posts, see blog/trending.py. A like counts half as much after
+# TRENDING_HALF_LIFE_HOURS, refresh_trending ignores likes older than
+# TRENDING_WINDOW_HALF_LIVES half-lives
+
+TRENDING_HALF_LIFE_HOURS = 24
+TRENDING_WINDOW_HALF_LIVES = 10
+
+
+# Full-text search of GET /posts/search/, see blog/search.py.
+# blog.search.DatabaseBackend works without an index on other databases
+
+POST_SEARCH_BACKEND = 'blog.search.SQLiteFTSBackend'
+
+
+# /users/{id}/posts/ and /posts/mine/ read the POST_TIMELINE_SIZE newest
+# Posts of an author by the ids cached in the 'posts' cache, see blog/timeline.py
+
+POST_TIMELINE_SIZE = 100
+
+
+# QueryMetricsMiddleware sends the queries and timings of every request in
+# a Server-Timing header, see test_task/metrics.py
+
+QUERY_METRICS_SERVER_TIMING = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -104,6 +226,35 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing
+# https://docs.djangoproject.com/en/2.1/topics/auth/passwords/
+# 'fast' is for the test suite and load-test seeding only. It keeps the other
+# hashers, so passwords hashed with them still verify. TEST_RUNNER switches
+# to it for manage.py test, DJANGO_PASSWORD_HASHER_PROFILE=fast elsewhere
+
+PASSWORD_HASHER_PROFILES = {
+    'default': [
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.BCryptPasswordHasher',
+    ],
+    'fast': [
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    ],
+}
+PASSWORD_HASHER_PROFILE = os.environ.get('DJANGO_PASSWORD_HASHER_PROFILE', 'default')
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]
+
+# Worker processes hashing passwords in user_profile.bulk, None for one per CPU
+BULK_REGISTRATION_PROCESSES = None
+
+TEST_RUNNER = 'test_task.testing.TestRunner'
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.1/topics/i18n/
 
@@ -134,7 +285,7 @@ REST_FRAMEWORK = {
     ),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
+        'user_profile.authentication.StatelessJSONWebTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
@@ -0,0 +1,89 @@
+"""
+Production profile for API-only deployments.
+
+    DJANGO_SETTINGS_MODULE=test_task.settings_production
+    DJANGO_SECRET_KEY=...
+
+/posts/, /users/ and the token endpoints go through a minimal middleware
+stack and authenticate with JWT only. /admin/ keeps sessions, CSRF,
+messages and clickjacking protection through AdminOnlyMiddleware.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from test_task.settings import *  # noqa: F401,F403
+from test_task.settings import CACHES, PASSWORD_HASHER_PROFILES, REST_FRAMEWORK
+
+# Signs the JWTs, whose claims are trusted without a query: never the key of the repository
+try:
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured('Set the DJANGO_SECRET_KEY environment variable.')
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+MIDDLEWARE = [
+    'test_task.middleware.QueryMetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'test_task.middleware.AdminOnlyMiddleware',
+]
+
+# Run by AdminOnlyMiddleware for paths starting with ADMIN_ONLY_MIDDLEWARE_PATHS
+ADMIN_ONLY_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+ADMIN_ONLY_MIDDLEWARE_PATHS = ['/admin/']
+
+# The admin checks look for these middleware in MIDDLEWARE only
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
+# No Session and Basic auth: Basic hashes the password on every request
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    DEFAULT_AUTHENTICATION_CLASSES=(
+        'user_profile.authentication.StatelessJSONWebTokenAuthentication',
+    ),
+    DEFAULT_RENDERER_CLASSES=(
+        'rest_framework.renderers.JSONRenderer',
+    ),
+)
+
+# Caches in tables every process reads, create them with manage.py createcachetable.
+# Deny-list entries expire with the tokens they revoke. A version bumped by a
+# write in one process invalidates the cached responses of all of them, and a
+# client pinned by a write reads from the primary whichever process answers
+CACHES = dict(
+    CACHES,
+    tokens={
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'jwt_deny_list',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10 ** 9,
+        },
+    },
+    posts=dict(
+        CACHES['posts'],
+        BACKEND='django.core.cache.backends.db.DatabaseCache',
+        LOCATION='posts_cache',
+    ),
+    replicas=dict(
+        CACHES['replicas'],
+        BACKEND='django.core.cache.backends.db.DatabaseCache',
+        LOCATION='replica_pins',
+    ),
+)
+
+# Never the fast hasher profile, whatever the environment says
+PASSWORD_HASHER_PROFILE = 'default'
+PASSWORD_HASHERS = PASSWORD_HASHER_PROFILES[PASSWORD_HASHER_PROFILE]
+
+# Query counts and timings are not sent to clients, the middleware still records them
+QUERY_METRICS_SERVER_TIMING = False
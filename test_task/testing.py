@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from test_task import metrics
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the tests with the 'fast' password hasher profile, see PASSWORD_HASHER_PROFILES"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.hashers = override_settings(PASSWORD_HASHERS=settings.PASSWORD_HASHER_PROFILES['fast'])
+        self.hashers.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.hashers.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Fail a test if one of its requests runs more queries than the budget of its view.
+
+    Budgets are declared per view name, as test_task.metrics.view_name() gives it:
+
+        query_budgets = {'PostAPIView.list': 4}
+
+    default_query_budget applies to the views that are not listed, None means no limit.
+    Needs QueryMetricsMiddleware in MIDDLEWARE
+    """
+    query_budgets = {}
+    default_query_budget = None
+
+    def setUp(self):
+        super().setUp()
+        self.over_budget = []
+        metrics.request_measured.connect(self.check_query_budget)
+        self.addCleanup(self.assert_within_query_budgets)
+        self.addCleanup(metrics.request_measured.disconnect, self.check_query_budget)
+
+    def assert_within_query_budgets(self):
+        self.assertFalse(self.over_budget, 'Requests over their query budget:\n' + '\n'.join(self.over_budget))
+
+    def check_query_budget(self, sender, view, metrics, **kwargs):
+        budget = self.query_budgets.get(view, self.default_query_budget)
+        if budget is not None and metrics.queries > budget:
+            self.over_budget.append('{}: {} queries, budget {}'.format(view, metrics.queries, budget))
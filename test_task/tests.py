@@ -0,0 +1,331 @@
+import importlib
+import os
+import re
+import sqlite3
+import tempfile
+import unittest
+from collections import OrderedDict
+from datetime import datetime
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, connections, router
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import utc
+from rest_framework import serializers
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+
+from blog import caching
+from blog.models import Post
+from test_task import metrics, replicas, serialization, settings as base_settings
+from test_task.db_backends.sqlite3.base import DatabaseWrapper
+from test_task.serialization import FastJSONRenderer, ValuesSerializerMixin
+from test_task.testing import QueryBudgetMixin
+
+# The production profile refuses to load without a secret key of its own
+with mock.patch.dict(os.environ, {'DJANGO_SECRET_KEY': 'production-test-key'}):
+    from test_task import settings_production
+
+
+@override_settings(MIDDLEWARE=settings_production.MIDDLEWARE,
+                   ADMIN_ONLY_MIDDLEWARE=settings_production.ADMIN_ONLY_MIDDLEWARE,
+                   ADMIN_ONLY_MIDDLEWARE_PATHS=settings_production.ADMIN_ONLY_MIDDLEWARE_PATHS)
+class TestAdminOnlyMiddleware(TestCase):
+    """Unit tests for the lean middleware stack of the production profile"""
+
+    def test_api_request_skips_admin_middleware(self):
+        """No session cookie and frame options for the API"""
+        response = Client().post('/users/', data={'username': 'test_user', 'password': 'test1234'})
+
+        self.assertEqual(201, response.status_code)
+        self.assertFalse(response.has_header('X-Frame-Options'))
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+    def test_admin_request_runs_admin_middleware(self):
+        """Admin redirects to login and sets frame options"""
+        response = Client().get('/admin/')
+
+        self.assertEqual(302, response.status_code)
+        self.assertEqual('SAMEORIGIN', response['X-Frame-Options'])
+
+    def test_admin_login_checks_csrf(self):
+        """CSRF process_view runs for the admin: 403 without a token"""
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin1234')
+
+        response = Client(enforce_csrf_checks=True).post(
+            '/admin/login/', {'username': 'admin', 'password': 'admin1234'})
+
+        self.assertEqual(403, response.status_code)
+
+    def test_admin_login(self):
+        """Session and messages work for the admin"""
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin1234')
+        client = Client()
+
+        response = client.post('/admin/login/?next=/admin/',
+                               {'username': 'admin', 'password': 'admin1234'})
+        self.assertEqual(302, response.status_code)
+
+        response = client.get('/admin/')
+        self.assertEqual(200, response.status_code)
+
+
+class TestQueryMetrics(TestCase):
+    """Unit tests for QueryMetricsMiddleware and the query budgets of tests"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create(username='reader')
+        self.client.force_login(self.user)
+        metrics.reset()
+        caching.clear()
+
+    def test_server_timing_header(self):
+        """The header has the queries of the request and the durations"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/posts/')
+
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('serialization;dur=', timing)
+        self.assertIn('renderer;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        self.assertEqual(len(queries), int(re.search(r'desc="(\d+) queries"', timing).group(1)))
+
+    def test_snapshot_per_view(self):
+        """Requests add up under the view class and action that answered them"""
+        post = Post.objects.create(user=self.user, title='Title')
+        self.client.get('/posts/')
+        self.client.get('/posts/')
+        response = self.client.get('/users/{}/'.format(self.user.id))
+        self.client.get('/posts/{}/'.format(post.id))
+
+        snapshot = metrics.snapshot()
+
+        self.assertEqual({'PostAPIView.list', 'PostAPIView.retrieve', 'UserDetailAPIView.retrieve'}, set(snapshot))
+        self.assertEqual(2, snapshot['PostAPIView.list']['requests'])
+        self.assertEqual(len(response.content), snapshot['UserDetailAPIView.retrieve']['response_bytes'])
+        self.assertGreater(snapshot['PostAPIView.list']['mean_queries'], 0)
+        self.assertGreater(snapshot['PostAPIView.list']['renderer_ms'], 0)
+        self.assertGreater(snapshot['PostAPIView.retrieve']['serialization_ms'], 0)
+        self.assertGreater(snapshot['UserDetailAPIView.retrieve']['serialization_ms'], 0)
+
+    def test_serialization_of_lists_is_timed(self):
+        Post.objects.create(user=self.user, title='Title')
+        self.client.get('/posts/')
+
+        self.assertGreater(metrics.snapshot()['PostAPIView.list']['serialization_ms'], 0)
+
+    def test_no_server_timing_header_in_production(self):
+        self.assertFalse(settings_production.QUERY_METRICS_SERVER_TIMING)
+        with self.settings(QUERY_METRICS_SERVER_TIMING=False):
+            response = self.client.get('/posts/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(1, metrics.snapshot()['PostAPIView.list']['requests'])
+
+    def test_request_over_query_budget_fails_the_test(self):
+        """QueryBudgetMixin fails the test after it ran, with the view and its number of queries"""
+        client = self.client
+
+        class ListTest(QueryBudgetMixin, unittest.TestCase):
+            query_budgets = {'PostAPIView.list': 1}
+
+            def test_list(self):
+                client.get('/posts/')
+
+        result = unittest.TestResult()
+        ListTest('test_list').run(result)
+
+        self.assertEqual(1, len(result.failures))
+        self.assertIn('PostAPIView.list', result.failures[0][1])
+
+        ListTest.query_budgets = {'PostAPIView.list': 10}
+        result = unittest.TestResult()
+        ListTest('test_list').run(result)
+        self.assertTrue(result.wasSuccessful())
+
+
+class TestProductionSettings(SimpleTestCase):
+    """The production profile has no default for its secrets"""
+
+    def tearDown(self):
+        with mock.patch.dict(os.environ, {'DJANGO_SECRET_KEY': 'production-test-key'}):
+            importlib.reload(settings_production)
+
+    def test_secret_key_is_required(self):
+        with mock.patch.dict(os.environ, clear=True), self.assertRaises(ImproperlyConfigured):
+            importlib.reload(settings_production)
+
+
+class TestPasswordHashers(SimpleTestCase):
+    """The fast hasher profile is for the test runner only"""
+
+    def test_default_profile_has_no_md5(self):
+        default = base_settings.PASSWORD_HASHER_PROFILES['default']
+        self.assertNotIn('django.contrib.auth.hashers.MD5PasswordHasher', default)
+        self.assertEqual(default, settings_production.PASSWORD_HASHERS)
+
+    def test_test_runner_uses_fast_profile(self):
+        self.assertEqual(base_settings.PASSWORD_HASHER_PROFILES['fast'], settings.PASSWORD_HASHERS)
+
+
+class TestSerialization(SimpleTestCase):
+    """Unit tests for the values fast path of serializers and FastJSONRenderer"""
+
+    def test_fast_renderer_has_the_bytes_of_json_renderer(self):
+        """Escapes, unicode, datetimes and non-string keys come out as JSONRenderer writes them"""
+        data = OrderedDict([
+            ('text', 'Caf\u00e9 \u2028 \u2029 "quoted" \\ \x01 \x1f \u2603'),
+            ('created_at', datetime(2018, 5, 1, 12, 30, 0, 15, tzinfo=utc)),
+            ('likes', {1: {'liked': True, 'like_count': 2}}),
+            ('error', ErrorDetail('Invalid.', code='invalid')),
+            ('items', [None, 0, -1, 2 ** 40, False]),
+        ])
+
+        self.assertEqual(JSONRenderer().render(data), FastJSONRenderer().render(data))
+        self.assertEqual(JSONRenderer().render(data, 'application/json; indent=2'),
+                         FastJSONRenderer().render(data, 'application/json; indent=2'))
+
+    @unittest.skipUnless(serialization.orjson, 'orjson is not installed')
+    def test_orjson_has_the_bytes_of_json_renderer(self):
+        """The orjson branch renders the data itself, with the bytes of JSONRenderer"""
+        data = OrderedDict([
+            ('text', 'Caf\u00e9 \u2028 \u2029 "quoted" \\ \x01 \x1f \u2603'),
+            ('created_at', datetime(2018, 5, 1, 12, 30, 0, 15, tzinfo=utc)),
+            ('likes', {1: {'liked': True, 'like_count': 2}}),
+            ('items', [None, 0, -1, 2 ** 40, False, 'J\u00f6rg']),
+        ])
+        expected = JSONRenderer().render(data)
+
+        with mock.patch.object(JSONRenderer, 'render', side_effect=AssertionError('JSONRenderer fallback')):
+            self.assertEqual(expected, FastJSONRenderer().render(data))
+
+    def test_field_without_column_is_improperly_configured(self):
+        """A SerializerMethodField must be mapped to a column in values_columns"""
+        class UserNameSerializer(ValuesSerializerMixin, serializers.ModelSerializer):
+            name = serializers.SerializerMethodField()
+
+            class Meta:
+                model = User
+                fields = ['id', 'name']
+
+        with self.assertRaises(ImproperlyConfigured):
+            UserNameSerializer().get_values_plan()
+
+        UserNameSerializer.values_columns = {'name': 'username'}
+        self.assertEqual(['id', 'username'], UserNameSerializer().get_values_plan().columns)
+
+
+class TestSQLiteBackend(SimpleTestCase):
+    """Unit tests for the tuned SQLite backend"""
+
+    def get_wrapper(self, directory, **options):
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'db.sqlite3'))
+        settings_dict['OPTIONS'] = dict(settings_dict['OPTIONS'], **options)
+        wrapper = DatabaseWrapper(settings_dict)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_pragmas_on_new_connection(self):
+        """journal_mode, synchronous and busy_timeout are set when the connection opens"""
+        with tempfile.TemporaryDirectory() as directory:
+            with self.get_wrapper(directory).cursor() as cursor:
+                values = {}
+                for name in ('journal_mode', 'synchronous', 'busy_timeout'):
+                    cursor.execute('PRAGMA {}'.format(name))
+                    values[name] = cursor.fetchone()[0]
+
+        self.assertEqual({'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000}, values)
+
+    def test_transaction_mode(self):
+        """Transactions start with BEGIN IMMEDIATE"""
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = self.get_wrapper(directory)
+            with CaptureQueriesContext(wrapper) as queries:
+                wrapper._start_transaction_under_autocommit()
+            wrapper.rollback()
+
+        self.assertEqual('BEGIN IMMEDIATE', queries[-1]['sql'])
+
+
+# TransactionTestCase: the replica is a second connection to the test database
+# and only sees committed rows
+@override_settings(DATABASE_REPLICAS=['replica'])
+class TestReplicaRouting(TransactionTestCase):
+    """Unit tests for read replica routing"""
+
+    def setUp(self):
+        caches['replicas'].clear()
+        caching.clear()
+        self.reader = Client()
+        self.reader.force_login(User.objects.create(username='reader'))
+        self.writer = Client()
+        self.writer.force_login(User.objects.create(username='writer'))
+
+    def get_post_queries(self, client, url):
+        """Return the blog_post queries of the GET on the replica and on the primary"""
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connection) as primary:
+            response = client.get(url)
+        self.assertEqual(200, response.status_code)
+        return ([q for q in replica if '"blog_post"' in q['sql']],
+                [q for q in primary if '"blog_post"' in q['sql']])
+
+    def test_safe_requests_read_from_replica(self):
+        """Posts and users are read from the replica"""
+        post = Post.objects.create(user=User.objects.get(username='writer'), title='Title')
+
+        for url in ('/posts/', '/posts/{}/'.format(post.id)):
+            replica, primary = self.get_post_queries(self.reader, url)
+            self.assertTrue(replica)
+            self.assertFalse(primary)
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(200, self.reader.get('/users/').status_code)
+        self.assertTrue([q for q in replica if '"auth_user"' in q['sql']])
+
+    def test_writer_is_pinned_to_primary(self):
+        """After a write the writer reads from the primary, other clients from the replica"""
+        response = self.writer.post('/posts/', data={'title': 'Title'})
+        self.assertEqual(201, response.status_code)
+
+        replica, primary = self.get_post_queries(self.writer, '/posts/')
+        self.assertFalse(replica)
+        self.assertTrue(primary)
+
+        replica, primary = self.get_post_queries(self.reader, '/posts/')
+        self.assertTrue(replica)
+        self.assertFalse(primary)
+
+    def test_database_caches_read_from_primary(self):
+        """The cache tables of settings_production are read where they are written"""
+        cache_model = DatabaseCache('posts_cache', {}).cache_model_class
+        with replicas.replica_reads():
+            self.assertEqual('default', router.db_for_read(cache_model))
+            self.assertEqual('replica', router.db_for_read(Post))
+
+    def test_sync_replicas_copies_database(self):
+        """The replica file has the rows of the primary"""
+        Post.objects.create(user=User.objects.get(username='writer'), title='Title')
+
+        replica = connections['replica']
+        self.addCleanup(replica.settings_dict.__setitem__, 'NAME', replica.settings_dict['NAME'])
+
+        with tempfile.TemporaryDirectory() as directory:
+            replica.settings_dict['NAME'] = os.path.join(directory, 'replica.sqlite3')
+            call_command('sync_replicas', stdout=StringIO())
+
+            copy = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                self.assertEqual([('Title',)], copy.execute('SELECT title FROM blog_post').fetchall())
+                self.assertEqual('delete', copy.execute('PRAGMA journal_mode').fetchone()[0])
+            finally:
+                copy.close()
@@ -18,13 +18,18 @@ from django.urls import path, include
 from rest_framework import routers
 from rest_framework_jwt.views import obtain_jwt_token, refresh_jwt_token
 
+from blog.views import PostAPIView
+from user_profile.views import RevokeTokenAPIView
+
 router = routers.DefaultRouter()
 
 urlpatterns = [
     path('', include(router.urls)),
     path('users/', include('user_profile.urls')),
+    path('users/<int:user_pk>/posts/', PostAPIView.as_view({'get': 'user_posts'})),
     path('admin/', admin.site.urls),
     path('posts/', include('blog.urls')),
     path('api-token-auth/', obtain_jwt_token),
     path('api-token-refresh/', refresh_jwt_token),
+    path('api-token-revoke/', RevokeTokenAPIView.as_view()),
 ]
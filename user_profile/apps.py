@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class UserProfileConfig(AppConfig):
+    name = 'user_profile'
+
+    def ready(self):
+        from user_profile import signals  # noqa: F401
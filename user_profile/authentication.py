@@ -0,0 +1,66 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import ugettext as _
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+
+from user_profile.models import TokenUser
+
+
+# Deny-list cache, shared between processes and never culled, see CACHES in settings
+CACHE_ALIAS = 'tokens'
+REVOKED_LOGIN_KEY = 'jwt:revoked:{}:{}'
+REVOKED_USER_KEY = 'jwt:revoked-before:{}'
+
+
+def _login_key(payload):
+    # Refreshed tokens keep orig_iat, so this key covers the whole login session
+    return REVOKED_LOGIN_KEY.format(payload['user_id'], payload.get('orig_iat', payload['exp']))
+
+
+def _max_token_age():
+    return int(api_settings.JWT_REFRESH_EXPIRATION_DELTA.total_seconds())
+
+
+def revoke_token(payload):
+    """Reject the token of this payload and all tokens refreshed from it"""
+    caches[CACHE_ALIAS].set(_login_key(payload), True, timeout=_max_token_age())
+
+
+def revoke_user_tokens(user_id):
+    """Reject every token issued to the user until now"""
+    caches[CACHE_ALIAS].set(REVOKED_USER_KEY.format(user_id), int(time.time()), timeout=_max_token_age())
+
+
+def is_revoked(payload):
+    user_key = REVOKED_USER_KEY.format(payload['user_id'])
+    login_key = _login_key(payload)
+    revoked = caches[CACHE_ALIAS].get_many([user_key, login_key])
+    if revoked.get(login_key):
+        return True
+    revoked_before = revoked.get(user_key)
+    return revoked_before is not None and payload.get('orig_iat', 0) <= revoked_before
+
+
+class StatelessJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    JWT authentication that trusts the verified token claims instead of
+    loading the User on every request. request.user is a TokenUser, which
+    reads the database only when a view needs more than id and username.
+
+    Tokens are rejected through the cached deny-list: see revoke_token and
+    revoke_user_tokens. Deleted and deactivated users are revoked by signals.
+    """
+
+    def authenticate_credentials(self, payload):
+        if not payload.get('user_id') or not payload.get('username'):
+            raise exceptions.AuthenticationFailed(_('Invalid payload.'))
+
+        if is_revoked(payload):
+            raise exceptions.AuthenticationFailed(_('Token has been revoked.'))
+
+        return TokenUser.from_payload(payload, router.db_for_read(get_user_model()))
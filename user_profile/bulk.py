@@ -0,0 +1,97 @@
+"""
+Bulk user registration: rows are validated a batch at a time, passwords are
+hashed in a process pool and users are inserted with bulk_create.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+from test_task.batching import batches
+from user_profile.serializers import BulkRegistrationSerializer
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def username_taken():
+    message = User._meta.get_field('username').error_messages['unique']
+    return ValidationError({'username': [message]}, code='unique').detail
+
+
+def hash_passwords(passwords, executor=None, processes=1):
+    if executor is None or len(passwords) < 2 * processes:
+        return [make_password(password) for password in passwords]
+    chunksize = max(len(passwords) // (processes * 4), 1)
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+def register_users(rows, batch_size=DEFAULT_BATCH_SIZE, processes=None):
+    """
+    Create users from an iterable of registration dicts, as POST /users/ takes them.
+    Returns the number of users created and {row index: errors} for the rows skipped.
+    """
+    if processes is None:
+        processes = settings.BULK_REGISTRATION_PROCESSES or os.cpu_count() or 1
+    # Workers are started on first use, so small imports never fork
+    executor = ProcessPoolExecutor(processes) if processes > 1 else None
+    created, errors = 0, {}
+    try:
+        for number, batch in enumerate(batches(rows, batch_size)):
+            valid = validate_batch(batch, number * batch_size, errors)
+            passwords = hash_passwords([data['password'] for data in valid.values()], executor, processes)
+            users = [User(**dict(data, password=password)) for data, password in zip(valid.values(), passwords)]
+            created += insert_batch(list(valid), users, errors)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return created, errors
+
+
+def validate_batch(batch, offset, errors):
+    """Return {row index: validated data} for the rows of the batch that can be created"""
+    serializer = BulkRegistrationSerializer()
+    valid = {}
+    for index, row in enumerate(batch, offset):
+        try:
+            data = serializer.run_validation(row)
+        except ValidationError as exc:
+            errors[index] = exc.detail
+            continue
+        data['username'] = User.normalize_username(data['username'])
+        data['email'] = User.objects.normalize_email(data.get('email'))
+        valid[index] = data
+
+    usernames = [data['username'] for data in valid.values()]
+    taken = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    for index, data in list(valid.items()):
+        if data['username'] in taken:
+            errors[index] = username_taken()
+            del valid[index]
+        else:
+            # A later row of the same batch with this username is a duplicate
+            taken.add(data['username'])
+    return valid
+
+
+def insert_batch(indexes, users, errors):
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+        return len(users)
+    except IntegrityError:
+        pass
+
+    # A username was registered since the check, find it one row at a time
+    created = 0
+    for index, user in zip(indexes, users):
+        try:
+            with transaction.atomic():
+                user.save()
+            created += 1
+        except IntegrityError:
+            errors[index] = username_taken()
+    return created
@@ -0,0 +1,35 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from test_task.batching import NDJSONRows
+from user_profile.bulk import DEFAULT_BATCH_SIZE, register_users
+
+
+class Command(BaseCommand):
+    help = 'Create users from a file with one JSON registration per line, as POST /users/ takes it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file, or - for stdin')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of users validated and inserted per query')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes hashing passwords, one per CPU by default')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            created, errors = self.register(sys.stdin, options)
+        else:
+            with open(options['path'], encoding='utf-8') as lines:
+                created, errors = self.register(lines, options)
+
+        for number in sorted(errors):
+            self.stderr.write('Line {}: {}'.format(number, json.dumps(errors[number])))
+        self.stdout.write('Created {} users, skipped {}'.format(created, len(errors)))
+
+    def register(self, lines, options):
+        """Register the lines, return the number of users created and {line number: errors}"""
+        rows = NDJSONRows(lines)
+        created, errors = register_users(rows, batch_size=options['batch_size'], processes=options['processes'])
+        return created, rows.line_errors(errors)
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index auth_user.email for the prefix search of the user directory.
+    username is unique, so it has an index already
+    """
+
+    dependencies = [
+        ('auth', '0009_alter_user_last_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX user_profile_auth_user_email_idx ON auth_user (email)',
+            'DROP INDEX user_profile_auth_user_email_idx',
+        ),
+    ]
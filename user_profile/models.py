@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+
+
+class TokenUser(User):
+    """
+    User built from verified JWT claims, without a database query.
+
+    Only id and username are set. The other fields are deferred: the first
+    access to any of them loads all of them with one query.
+    """
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_payload(cls, payload, using):
+        return cls.from_db(using, ['id', 'username'], [payload['user_id'], payload['username']])
+
+    def refresh_from_db(self, using=None, fields=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields)
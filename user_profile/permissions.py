@@ -13,3 +13,14 @@ class IsOwner(permissions.BasePermission):
         # need obj.user for post model
         # obj here is a UserProfile instance
         return obj == request.user
+
+
+class IsAuthenticatedOrRegistering(permissions.BasePermission):
+    """
+    Anyone may register, only authenticated users may list and search users.
+    The list holds the emails of the users, anonymous clients could collect them all
+    """
+    def has_permission(self, request, view):
+        if request.method in permissions.SAFE_METHODS:
+            return request.user.is_authenticated
+        return True
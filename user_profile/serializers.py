@@ -1,8 +1,16 @@
+import jwt
 from django.contrib.auth.models import User
 from rest_framework import serializers
+from rest_framework_jwt.settings import api_settings
 
+from test_task.serialization import TimedSerializerMixin, ValuesSerializerMixin
 
-class RegistrationSerializer(serializers.ModelSerializer):
+# Maximum number of users in one bulk registration request. Their passwords are
+# hashed in the request process, larger imports use the import_users command
+MAX_BULK_REGISTRATIONS = 200
+
+
+class RegistrationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializers registration requests and creates a new user."""
 
     password = serializers.CharField(
@@ -20,8 +28,34 @@ class RegistrationSerializer(serializers.ModelSerializer):
         return User.objects.create_user(**validated_data)
 
 
-class UserSerializer(serializers.ModelSerializer):
-    """Serializers detail fields about user"""
+class BulkRegistrationSerializer(RegistrationSerializer):
+    """
+    Registration without the unique username query per row.
+    user_profile.bulk checks uniqueness with one query per batch instead.
+    """
+
+    username = serializers.CharField(
+        max_length=User._meta.get_field('username').max_length,
+        validators=[User.username_validator]
+    )
+
+
+class UserSerializer(TimedSerializerMixin, ValuesSerializerMixin, serializers.ModelSerializer):
+    """Serializers detail fields about user. Lists are serialized from values_queryset()"""
     class Meta:
         model = User
         fields = ['id', 'email', 'first_name', 'last_name', 'username']
+
+
+class TokenSerializer(serializers.Serializer):
+    """Serializer for a JWT. Validated data has the verified payload"""
+    token = serializers.CharField()
+
+    def validate(self, attrs):
+        try:
+            payload = api_settings.JWT_DECODE_HANDLER(attrs['token'])
+        except jwt.InvalidTokenError:
+            raise serializers.ValidationError('Invalid token.')
+        if 'user_id' not in payload:
+            raise serializers.ValidationError('Invalid payload.')
+        return {'token': attrs['token'], 'payload': payload}
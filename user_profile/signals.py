@@ -0,0 +1,16 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from user_profile.authentication import revoke_user_tokens
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_of_deleted_user(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens_of_deactivated_user(sender, instance, created, **kwargs):
+    if not created and not instance.is_active:
+        revoke_user_tokens(instance.pk)
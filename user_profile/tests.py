@@ -1,18 +1,51 @@
 # created by Seredyak1
 
 import json
+import os
+import tempfile
+from collections import OrderedDict
+from io import StringIO
+from unittest import skipUnless
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
 
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
-
-class TestUserApi(APITestCase):
+from user_profile.bulk import register_users
+from test_task.testing import QueryBudgetMixin
+from user_profile.models import TokenUser
+from user_profile.serializers import MAX_BULK_REGISTRATIONS, RegistrationSerializer
+
+
+class TestUserApi(QueryBudgetMixin, APITestCase):
+    # Measured queries per request, savepoints included
+    query_budgets = {
+        'RegistrationsAPIView.list': 1,
+        'RegistrationsAPIView.create': 2,
+        'BulkRegistrationAPIView.post': 6,
+        'UserDetailAPIView.retrieve': 4,
+        'UserDetailAPIView.update': 5,
+        'UserDetailAPIView.partial_update': 4,
+        'UserDetailAPIView.destroy': 9,
+        'ObtainJSONWebToken.post': 1,
+        'RefreshJSONWebToken.post': 1,
+        'RevokeTokenAPIView.post': 0,
+    }
+    default_query_budget = 3
 
     def setUp(self):
-        """Create client before every test"""
+        """Create client and clear the token deny-list before every test"""
+        super().setUp()
         self.client = Client()
+        caches['tokens'].clear()
 
 #test user creation with good and wrong data
     def test_user_registration(self):
@@ -35,12 +68,176 @@ class TestUserApi(APITestCase):
     def test_get_list_of_users(self):
         """Assert a 201 status code was returned.
         As 1 register user - len(response.data)==1"""
+        token = self.get_token()
+
+        response = self.client.get('/users/', HTTP_AUTHORIZATION='JWT ' + token)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(response.data['results']))
+
+    def test_get_list_of_users_by_pages(self):
+        """Assert all users are returned once when following next links"""
+        token = self.get_token()
+        for i in range(5):
+            User.objects.create(username='user_{}'.format(i))
+
+        usernames = []
+        response = self.client.get('/users/', {'page_size': 2}, HTTP_AUTHORIZATION='JWT ' + token)
+        while True:
+            usernames += [user['username'] for user in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'], HTTP_AUTHORIZATION='JWT ' + token)
+
+        self.assertEqual(['test_user'] + ['user_{}'.format(i) for i in range(5)], usernames)
+
+    def test_list_of_users_has_the_bytes_of_the_serializer(self):
+        """Users serialized from rows render as RegistrationSerializer.data of the instances did"""
+        User.objects.create(username='user_1', email='user@example.com', first_name='J\u00f6rg\u2028')
+        User.objects.create(username='user_2')
+        token = self.get_token()
+
+        response = self.client.get('/users/', HTTP_AUTHORIZATION='JWT ' + token)
+
+        expected = OrderedDict([('next', None), ('previous', None),
+                                ('results', RegistrationSerializer(User.objects.order_by('id'), many=True).data)])
+        self.assertEqual(JSONRenderer().render(expected), response.content)
+
+    def test_search_users_by_prefix(self):
+        """Assert ?q= keeps users whose username or email starts with it"""
+        User.objects.create(username='anna', email='a@example.com')
+        User.objects.create(username='bob', email='annabelle@example.com')
+        User.objects.create(username='hanna', email='h@example.com')
+        token = self.get_token()
+
+        response = self.client.get('/users/', {'q': 'ann'}, HTTP_AUTHORIZATION='JWT ' + token)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['anna', 'bob'], [user['username'] for user in response.data['results']])
+
+    def test_list_users_if_unauthorized(self):
+        """Assert anonymous clients can register but cannot list or search users"""
+        User.objects.create(username='bob', email='annabelle@example.com')
+
+        self.assertEqual(401, self.client.get('/users/', {'q': 'ann'}).status_code)
+        self.assertEqual(401, self.client.get('/users/').status_code)
         self.test_user_registration()
 
-        response = self.client.get('/users/')
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+    def test_search_users_uses_indexes(self):
+        """Assert the prefix search reads both columns through their index"""
+        queryset = User.objects.filter(Q(username__gte='ann', username__lt='ann\U0010ffff') |
+                                       Q(email__gte='ann', email__lt='ann\U0010ffff'))
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+
+        self.assertIn('user_profile_auth_user_email_idx', plan)
+        self.assertNotIn('SCAN auth_user', plan)
+
+#test bulk registration
+    def test_bulk_registration_by_admin(self):
+        """Assert valid rows are created and the others are returned with their index"""
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin1234')
+        User.objects.create(username='taken')
+        self.client.force_login(User.objects.get(username='admin'))
+        rows = [
+            {"username": "bulk_1", "password": "test1234", "email": "bulk_1@EXAMPLE.com"},
+            {"username": "bulk_2", "password": "test1234"},
+            {"username": "bulk_1", "password": "test1234"},
+            {"username": "taken", "password": "test1234"},
+            {"username": "", "password": "123"},
+        ]
+
+        response = self.client.post('/users/bulk/', data=json.dumps(rows), content_type='application/json')
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(2, response.data['created'])
+        self.assertEqual([2, 3, 4], [error['index'] for error in response.data['errors']])
+        self.assertIn('username', response.data['errors'][0]['errors'])
+        self.assertEqual('bulk_1@example.com', User.objects.get(username='bulk_1').email)
+        self.assertTrue(User.objects.get(username='bulk_2').check_password('test1234'))
+
+    def test_bulk_registration_is_not_admin(self):
+        """Assert a 403 status code for a user who is not staff"""
+        self.client.force_login(User.objects.create(username='test_user'))
+        rows = [{"username": "bulk_1", "password": "test1234"}]
+
+        response = self.client.post('/users/bulk/', data=json.dumps(rows), content_type='application/json')
+
+        self.assertEqual(403, response.status_code)
+        self.assertEqual(1, User.objects.count())
+
+    def test_bulk_registration_without_new_users(self):
+        """Assert a 200 status code with nothing created for an empty list and for invalid rows"""
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin1234'))
+
+        response = self.client.post('/users/bulk/', data='[]', content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({'created': 0, 'errors': []}, response.data)
 
+        response = self.client.post('/users/bulk/', data='[{"username": ""}]', content_type='application/json')
         self.assertEqual(200, response.status_code)
-        self.assertEqual(1, len(response.data))
+        self.assertEqual([0], [error['index'] for error in response.data['errors']])
+
+        response = self.client.post('/users/bulk/', data='{"username": "bulk_1"}', content_type='application/json')
+        self.assertEqual(400, response.status_code)
+
+    def test_bulk_registration_too_many_rows(self):
+        """Assert a 400 status code and no user created above MAX_BULK_REGISTRATIONS rows"""
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin1234'))
+        rows = [{"username": "bulk_{}".format(i), "password": "test1234"}
+                for i in range(MAX_BULK_REGISTRATIONS + 1)]
+
+        response = self.client.post('/users/bulk/', data=json.dumps(rows), content_type='application/json')
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(1, User.objects.count())
+
+    def test_bulk_registration_queries_per_batch(self):
+        """Assert the number of queries does not grow with the number of rows"""
+        rows = [{"username": "bulk_{}".format(i), "password": "test1234"} for i in range(40)]
+
+        with CaptureQueriesContext(connection) as small:
+            register_users(rows[:20], batch_size=20, processes=1)
+        with CaptureQueriesContext(connection) as large:
+            register_users(rows[20:], batch_size=40, processes=1)
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(40, User.objects.count())
+
+    def test_import_users_command(self):
+        """Assert users from an NDJSON file are created, hashing in worker processes"""
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as ndjson:
+            for i in range(6):
+                ndjson.write(json.dumps({"username": "bulk_{}".format(i), "password": "test1234"}) + '\n')
+            ndjson.write(json.dumps({"username": "bulk_0", "password": "test1234"}) + '\n')
+        self.addCleanup(os.remove, ndjson.name)
+        out, err = StringIO(), StringIO()
+
+        call_command('import_users', ndjson.name, batch_size=4, processes=2, stdout=out, stderr=err)
+
+        self.assertIn('Created 6 users, skipped 1', out.getvalue())
+        self.assertIn('Line 7:', err.getvalue())
+        self.assertTrue(User.objects.get(username='bulk_5').check_password('test1234'))
+
+    def test_import_users_command_skips_bad_lines(self):
+        """Assert blank lines are skipped and lines that are not JSON are reported, the others registered"""
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as ndjson:
+            ndjson.write('{"username": "bulk_1", "password": "test1234"}\n\nnot json\n')
+            ndjson.write('{"username": "bulk_2", "password": "test1234"}\n')
+            ndjson.write('{"username": "bulk_1", "password": "test1234"}\n')
+        self.addCleanup(os.remove, ndjson.name)
+        out, err = StringIO(), StringIO()
+
+        call_command('import_users', ndjson.name, batch_size=2, processes=1, stdout=out, stderr=err)
+
+        self.assertIn('Created 2 users, skipped 2', out.getvalue())
+        errors = err.getvalue().splitlines()
+        self.assertEqual(['Line 3', 'Line 5'], [line.split(':')[0] for line in errors])
+        self.assertIn('Invalid JSON', errors[0])
+        self.assertIn('username', errors[1])
 
 #test user login with JWT token
     def test_user_login_with_right_data(self):
@@ -76,6 +273,81 @@ class TestUserApi(APITestCase):
 
         self.assertEqual(200, response.status_code)
 
+#test stateless JWT authentication and token revocation
+    def get_token(self):
+        self.test_user_registration()
+        login_data = {"username": "test_user", "password": "test1234"}
+        return self.client.post('/api-token-auth/', data=login_data).data['token']
+
+    def test_jwt_auth_does_not_load_user(self):
+        """Assert a 200 status code without a query for the authenticated user"""
+        token = self.get_token()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/posts/', HTTP_AUTHORIZATION='JWT ' + token)
+
+        self.assertEqual(200, response.status_code)
+        self.assertFalse([q for q in queries if 'FROM "auth_user"' in q['sql']])
+
+    def test_token_user_loads_other_fields_at_once(self):
+        """Fields other than id and username are loaded with one query on first access"""
+        User.objects.create(username='test_user', email='test@example.com', first_name='Test')
+        user = User.objects.get(username='test_user')
+        token_user = TokenUser.from_payload({'user_id': user.id, 'username': 'test_user'}, 'default')
+
+        with self.assertNumQueries(1):
+            self.assertEqual('test@example.com', token_user.email)
+            self.assertEqual('Test', token_user.first_name)
+            self.assertEqual(True, token_user.is_active)
+        self.assertEqual(user, token_user)
+
+    def test_revoked_token(self):
+        """Assert a 401 status code for a revoked token and for a token refreshed from it"""
+        token = self.get_token()
+        user = User.objects.get(username='test_user')
+        refreshed = self.client.post('/api-token-refresh/', data={'token': token}).data['token']
+
+        response = self.client.post('/api-token-revoke/', data={'token': token})
+        self.assertEqual(204, response.status_code)
+
+        for revoked in (token, refreshed):
+            response = self.client.get('/users/{}/'.format(user.id), HTTP_AUTHORIZATION='JWT ' + revoked)
+            self.assertEqual(401, response.status_code)
+
+    def test_revoked_token_after_other_caches_cull(self):
+        """Assert a 401 status code for a revoked token once the other caches are full"""
+        token = self.get_token()
+        self.client.post('/api-token-revoke/', data={'token': token})
+
+        for alias, options in settings.CACHES.items():
+            if alias != 'tokens':
+                max_entries = options.get('OPTIONS', {}).get('MAX_ENTRIES', 300)
+                caches[alias].set_many({'fill:{}'.format(number): number for number in range(max_entries + 1)})
+
+        response = self.client.get('/posts/', HTTP_AUTHORIZATION='JWT ' + token)
+        self.assertEqual(401, response.status_code)
+
+    def test_revoke_wrong_token(self):
+        """Assert a 400 status code for a token with a wrong signature"""
+        response = self.client.post('/api-token-revoke/', data={'token': 'wrong.token.value'})
+
+        self.assertEqual(400, response.status_code)
+
+    def test_tokens_of_deleted_user_are_revoked(self):
+        """Assert a 401 status code for a token of a deleted or deactivated user"""
+        token = self.get_token()
+        user = User.objects.get(username='test_user')
+        user.is_active = False
+        user.save()
+
+        response = self.client.get('/users/{}/'.format(user.id), HTTP_AUTHORIZATION='JWT ' + token)
+        self.assertEqual(401, response.status_code)
+
+        caches['tokens'].clear()
+        user.delete()
+        response = self.client.get('/posts/', HTTP_AUTHORIZATION='JWT ' + token)
+        self.assertEqual(401, response.status_code)
+
 # get user detail if authorized or unauthorized
     def test_get_user_by_id_if_authorized(self):
         """Assert a 201 status code was returned"""
@@ -98,6 +370,21 @@ class TestUserApi(APITestCase):
         self.assertEqual(401, response.status_code)
         self.assertEqual('Unauthorized', response.status_text)
 
+    def test_get_user_by_id_with_if_none_match(self):
+        """Assert a 304 status code for the current ETag, 200 after update"""
+        user = User.objects.create(username='test_user')
+        self.client.force_login(user)
+        url = '/users/{}/'.format(user.id)
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+        self.client.patch(url, data=json.dumps({"first_name": "new name"}), content_type='application/json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('new name', response.data['first_name'])
+
 #Update. patch and delete user, if owner
     def test_update_user_by_id_if_owner(self):
         """Assert a 200 status code was returned, all parameters is not same"""
@@ -1,8 +1,9 @@
 from django.urls import path
 
-from user_profile.views import RegistrationsAPIView, UserDetailAPIView
+from user_profile.views import BulkRegistrationAPIView, RegistrationsAPIView, UserDetailAPIView
 
 urlpatterns = [
     path('', RegistrationsAPIView.as_view()),
+    path('bulk/', BulkRegistrationAPIView.as_view()),
     path('<int:pk>/', UserDetailAPIView.as_view()),
 ]
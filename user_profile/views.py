@@ -1,36 +1,97 @@
+from functools import partial
+
 from django.contrib.auth.models import User
+from django.db.models import Q
 from rest_framework import status, permissions
 from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import generics
 
-from user_profile.permissions import IsOwner
-from .serializers import RegistrationSerializer, UserSerializer
+from test_task.conditional import conditional_response, make_etag
+from test_task.replicas import ReplicaReadsMixin
+from test_task.serialization import FAST_RENDERER_CLASSES
+from user_profile.authentication import revoke_token
+from user_profile.bulk import register_users
+from user_profile.pagination import UserCursorPagination
+from user_profile.permissions import IsAuthenticatedOrRegistering, IsOwner
+from .serializers import (MAX_BULK_REGISTRATIONS, BulkRegistrationSerializer, RegistrationSerializer, TokenSerializer,
+                          UserSerializer)
+
 
+# Sorts after any other character, so [q, q + LAST_CHARACTER) holds every string starting with q
+LAST_CHARACTER = '\U0010ffff'
 
-class RegistrationsAPIView(generics.ListCreateAPIView):
+
+class RegistrationsAPIView(ReplicaReadsMixin, generics.ListCreateAPIView):
     """
     get:
-    Return a list of all the existing users.
+    Return a page of the existing users. Follow the `next` link for the next page.
+    `?q=` keeps users whose username or email starts with it (case-sensitive). Authenticated users only
 
     post:
-    Create a new user instance.
+    Create a new user instance. Open to anyone
     """
 
-    permission_classes = (AllowAny,)
+    permission_classes = (IsAuthenticatedOrRegistering,)
     serializer_class = RegistrationSerializer
     queryset = User.objects.all()
+    pagination_class = UserCursorPagination
+    renderer_classes = FAST_RENDERER_CLASSES
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        q = self.request.query_params.get('q')
+        if q:
+            # A range instead of LIKE 'q%', so both columns are searched on their index
+            end = q + LAST_CHARACTER
+            queryset = queryset.filter(Q(username__gte=q, username__lt=end) | Q(email__gte=q, email__lt=end))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # Users are listed with the fields of RegistrationSerializer that are not write only,
+        # from rows of their columns instead of User instances
+        serializer = UserSerializer(context=self.get_serializer_context())
+        page = self.paginate_queryset(serializer.values_queryset(self.filter_queryset(self.get_queryset())))
+        return self.get_paginated_response(serializer.to_representation_values(page))
 
     def post(self, request, *args, **kwargs):
 
-        serializer = self.serializer_class(data=request.data)
+        serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class UserDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
+class BulkRegistrationAPIView(generics.GenericAPIView):
+    """
+    post:
+    Create users from a JSON array of at most MAX_BULK_REGISTRATIONS registrations. Admin only.
+    Invalid rows are skipped and returned in `errors` with their index.
+    201 if users were created, 200 otherwise, 400 if the body is not a list
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    serializer_class = BulkRegistrationSerializer
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of registrations.']})
+        if len(request.data) > MAX_BULK_REGISTRATIONS:
+            raise ValidationError({'non_field_errors': [
+                'Ensure there are no more than {} registrations.'.format(MAX_BULK_REGISTRATIONS)]})
+
+        # No worker processes per request, the import_users command has them
+        created, errors = register_users(request.data, processes=1)
+
+        data = {
+            'created': created,
+            'errors': [{'index': index, 'errors': errors[index]} for index in sorted(errors)],
+        }
+        return Response(data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+class UserDetailAPIView(ReplicaReadsMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     get:
     Return a user detail
@@ -44,3 +105,28 @@ class UserDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (permissions.IsAuthenticated, IsOwner)
     serializer_class = UserSerializer
     queryset = User.objects.all()
+
+    def retrieve(self, request, *args, **kwargs):
+        # User has no modification time, so the ETag hashes the serialized columns
+        values = User.objects.filter(pk=kwargs['pk']).values_list(*UserSerializer.Meta.fields).first()
+        if values is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        get_response = partial(super().retrieve, request, *args, **kwargs)
+        return conditional_response(request, get_response, etag=make_etag(request, *values))
+
+
+class RevokeTokenAPIView(generics.GenericAPIView):
+    """
+    post:
+    Revoke the given JWT and every token refreshed from it.
+    """
+    permission_classes = (AllowAny,)
+    serializer_class = TokenSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        revoke_token(serializer.validated_data['payload'])
+
+        return Response(status=status.HTTP_204_NO_CONTENT)